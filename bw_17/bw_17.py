@@ -84,4 +84,448 @@ print('example 5, 6, 7')
 print(percentages_6)
 print(percentages_7)
 
+
+# example 8: 스트리밍 normalize
+# 첫 번째 패스는 파일을 청크 단위로 읽어 합계만 구하고, 두 번째 패스에서 퍼센트를 청크 단위로 흘려보냄
+# -> 메모리 사용량은 chunk_size로 제한됨. 합계를 알아야 퍼센트를 낼 수 있으므로 메모리를 제한하면 두 패스는 피할 수 없음
+# spill=True는 파싱한 값을 int64 임시 파일에 써 두고 두 번째 패스에서 그것을 읽음
+# 두 번째 파싱을 피하는 대신 I/O는 늘어남(값마다 8바이트 쓰기 + 읽기). 그래서 기본값은 꺼져 있음
+from array import array
+from tempfile import TemporaryFile, TemporaryDirectory
+import os
+
+
+class PassStats(object):
+    def __init__(self):
+        self.bytes_read = [] # 패스별로 읽은 바이트 수
+        self.bytes_written = 0 # spill 파일에 쓴 바이트 수
+
+    def add_pass(self, nbytes):
+        self.bytes_read.append(nbytes)
+
+    @property
+    def total_bytes(self):
+        return sum(self.bytes_read) + self.bytes_written
+
+
+def iter_text_chunks(data_path, chunk_size, stats):
+    nbytes = 0
+    chunk = array('q')
+    with open(data_path, 'rb') as f:
+        for line in f:
+            nbytes += len(line)
+            chunk.append(int(line))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = array('q')
+    if chunk:
+        yield chunk
+    stats.add_pass(nbytes)
+
+
+def iter_spill_chunks(spill_file, chunk_size, stats):
+    nbytes = 0
+    while True:
+        chunk = array('q')
+        try:
+            chunk.fromfile(spill_file, chunk_size)
+        except EOFError:
+            pass # 마지막 청크는 chunk_size보다 작을 수 있음. 읽은 값은 chunk에 남아 있음
+        if not chunk:
+            break
+        nbytes += len(chunk) * chunk.itemsize
+        yield chunk
+    stats.add_pass(nbytes)
+
+
+def normalize_stream(data_path, chunk_size=65536, stats=None, spill=False):
+    """
+    Normalize a visit file into percentages, chunk_size values at a time.
+
+    The file is read twice: once for the total and once for the percentages.
+
+    :param data_path: Text file with one visit count per line
+    :param chunk_size: Number of values held in memory at once
+    :param stats: PassStats that records the bytes read by each pass and the bytes spilled
+    :param spill: Write parsed values to a temporary int64 file and read them back instead of parsing
+        the text file twice. This avoids the second parse but adds I/O: 8 bytes written and read per value,
+        usually more than the text itself.
+    :return: Generator of lists of percentages
+    """
+    if stats is None:
+        stats = PassStats()
+    total = 0
+    with TemporaryFile() as spill_file:
+        for chunk in iter_text_chunks(data_path, chunk_size, stats):
+            total += sum(chunk)
+            if spill:
+                chunk.tofile(spill_file)
+                stats.bytes_written += len(chunk) * chunk.itemsize
+        if spill:
+            spill_file.seek(0)
+            chunks = iter_spill_chunks(spill_file, chunk_size, stats)
+        else:
+            chunks = iter_text_chunks(data_path, chunk_size, stats)
+        for chunk in chunks:
+            yield [100 * value / total for value in chunk]
+
+
+def normalize_to_file(data_path, out_path, chunk_size=65536, spill=False):
+    stats = PassStats()
+    with open(out_path, 'w') as out:
+        for percents in normalize_stream(data_path, chunk_size, stats, spill):
+            out.write(''.join('%r\n' % percent for percent in percents))
+    return stats
+
+
+print('example 8')
+stats = PassStats()
+percentages_8 = []
+for percents in normalize_stream(path, chunk_size=2, stats=stats):
+    percentages_8.extend(percents)
+assert percentages_8 == percentages_2
+print(percentages_8)
+print('bytes read per pass:', stats.bytes_read)
+
+with TemporaryDirectory() as tmpdir:
+    out_path = os.path.join(tmpdir, 'percentages.txt')
+    stats = normalize_to_file(path, out_path, chunk_size=2, spill=True)
+    with open(out_path) as f:
+        assert [float(line) for line in f] == percentages_2
+print('bytes read per pass (spill):', stats.bytes_read, 'spill bytes written:', stats.bytes_written)
+
+
+# example 9: 바이너리(int64 고정 폭) 방문 파일 + 메모리 맵 reader
+# 텍스트 한 줄마다 int(line)을 호출하는 비용을 없애기 위해 한 번만 바이너리로 변환해 둠
+# MappedVisits는 파일을 mmap으로 열고 memoryview로 노출하므로 복사가 없고, 여러 번 순회해도 파싱 비용이 없음
+import mmap
+import sys
+
+
+def convert_visits(text_path, bin_path, chunk_size=65536):
+    stats = PassStats()
+    count = 0
+    with open(bin_path, 'wb') as out:
+        for chunk in iter_text_chunks(text_path, chunk_size, stats):
+            if sys.byteorder == 'big': # 파일은 항상 little-endian int64로 저장
+                chunk.byteswap()
+            chunk.tofile(out)
+            count += len(chunk)
+    return count
+
+
+class MappedVisits(object):
+    def __init__(self, data_path):
+        self.data_path = data_path
+        self._file = open(data_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size % 8:
+            self._file.close()
+            raise ValueError('%s is not an int64 visit file' % data_path)
+        if size and sys.byteorder == 'big':
+            # 파일은 little-endian이므로 big-endian 호스트에서는 바이트 순서를 바꾼 복사본을 씀
+            values = array('q')
+            values.fromfile(self._file, size // 8)
+            values.byteswap()
+            self._mmap = None
+            self.values = memoryview(values)
+        elif size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.values = memoryview(self._mmap).cast('q')
+        else:
+            self._mmap = None # 빈 파일은 mmap 할 수 없음
+            self.values = memoryview(b'').cast('q')
+
+    def __iter__(self):
+        return iter(self.values) # 호출할 때마다 새 이터레이터 -> normalize_defensive에 그대로 넘길 수 있음
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def close(self):
+        try:
+            self.values.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            pass # 아직 살아 있는 view(예: as_visit_array의 NumPy 배열)가 있으면 mmap은 마지막 view가 사라질 때 해제됨
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+print('example 9')
+with TemporaryDirectory() as tmpdir:
+    bin_path = os.path.join(tmpdir, 'my_numbers.q')
+    convert_visits(path, bin_path)
+    with MappedVisits(bin_path) as mapped_visits:
+        percentages_9 = normalize_defensive(mapped_visits)
+        assert percentages_9 == normalize_defensive(mapped_visits) == percentages_6
+print(percentages_9)
+
+
+# example 10: NumPy 벡터화 backend
+# 합계와 퍼센트 계산을 배열 연산 한 번으로 처리. NumPy가 없으면 기존 리스트 버전(normalize_copy)으로 동작
+# MappedVisits는 np.frombuffer로 복사 없이 배열로 만들고, ReadVisit이나 제너레이터는 한 번만 순회해서 배열을 채움
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def as_visit_array(numbers):
+    if isinstance(numbers, np.ndarray):
+        return numbers
+    if isinstance(numbers, MappedVisits):
+        return np.frombuffer(numbers.values, dtype=np.int64) # values는 항상 호스트 바이트 순서
+    if isinstance(numbers, (list, tuple, array)):
+        return np.asarray(numbers)
+    return np.fromiter(numbers, dtype=np.int64)
+
+
+def normalize_vectorized(numbers):
+    if np is None:
+        return normalize_copy(numbers)
+    values = as_visit_array(numbers)
+    return 100 * values / values.sum()
+
+
+def check_normalize_backends(numbers):
+    expected = normalize_copy(numbers)
+    actual = normalize_vectorized(numbers)
+    assert len(expected) == len(actual)
+    return max((abs(a - b) for a, b in zip(expected, actual)), default=0.0)
+
+
+def benchmark_normalize(sizes=(10**6, 10**7, 10**8), python_limit=10**7):
+    # 10**8개를 리스트로 만들면 메모리가 부족하므로 python_limit보다 큰 크기는 리스트 버전을 건너뜀
+    rows = []
+    for size in sizes:
+        row = {'size': size, 'python': None, 'numpy': None}
+        if size <= python_limit:
+            numbers = list(range(1, size + 1))
+            start = perf_counter()
+            normalize_defensive(numbers)
+            row['python'] = int(size / (perf_counter() - start))
+            del numbers
+        if np is not None:
+            numbers = np.arange(1, size + 1, dtype=np.int64)
+            start = perf_counter()
+            normalize_vectorized(numbers)
+            row['numpy'] = int(size / (perf_counter() - start))
+            del numbers
+        rows.append(row)
+    return rows
+
+
+print('example 10')
+percentages_10 = normalize_vectorized(visits)
+print([float(percent) for percent in percentages_10])
+assert check_normalize_backends(visits) == 0.0
+# 전체 측정은 benchmark_normalize()로 실행 (10**6 ~ 10**8)
+for row in benchmark_normalize(sizes=(10**4,)):
+    print('%(size)d elements: python=%(python)s/s numpy=%(numpy)s/s' % row)
+
+
+# example 11: 합계를 캐시하는 ReadVisit
+# 방문 로그는 뒤에 덧붙이기만 하므로 (합계, 읽은 위치)를 캐시해 두고, 다음 호출에서는 새로 추가된 부분만 읽음
+# 캐시 키는 파일 identity(st_dev, st_ino), 크기, mtime. 파일이 바뀌어 쓰였으면(작아짐, inode 변경,
+# 크기는 같은데 mtime 변경, 이미 읽은 마지막 바이트가 달라짐) 처음부터 다시 읽음
+class CachedReadVisit(ReadVisit):
+    _cache = {} # realpath -> dict(dev, ino, size, mtime_ns, offset, total, pending, tail)
+    tail_check_size = 64
+
+    def __init__(self, data_path):
+        super().__init__(data_path)
+        self.last_bytes_read = 0
+
+    def total(self):
+        key = os.path.realpath(self.data_path)
+        st = os.stat(key)
+        entry = self._cache.get(key)
+        if entry is not None and (entry['dev'], entry['ino']) != (st.st_dev, st.st_ino):
+            entry = None
+        if entry is not None and st.st_size < entry['offset']:
+            entry = None
+        if entry is not None and st.st_size == entry['size'] and st.st_mtime_ns != entry['mtime_ns']:
+            entry = None
+        if entry is not None and st.st_size == entry['size']:
+            self.last_bytes_read = 0
+            return entry['total'] + entry['pending']
+
+        with open(key, 'rb') as f:
+            if entry is not None:
+                tail = entry['tail']
+                f.seek(entry['offset'] - len(tail))
+                if f.read(len(tail)) != tail:
+                    entry = None
+            if entry is None:
+                entry = {'offset': 0, 'total': 0, 'tail': b''}
+                f.seek(0)
+            offset, total, pending = entry['offset'], entry['total'], 0
+            nbytes = 0
+            for line in f:
+                nbytes += len(line)
+                if not line.endswith(b'\n'):
+                    # 줄바꿈이 없는 마지막 줄도 __iter__는 내보내므로 합계에는 포함하되,
+                    # 아직 쓰는 중일 수 있으므로 offset은 넘기지 않고 다음 호출에서 다시 읽음
+                    pending = int(line)
+                    break
+                total += int(line)
+                offset += len(line)
+            f.seek(max(0, offset - self.tail_check_size))
+            tail = f.read(offset - f.tell())
+
+        self.last_bytes_read = nbytes + len(entry['tail'])
+        self._cache[key] = {
+            'dev': st.st_dev,
+            'ino': st.st_ino,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'offset': offset,
+            'total': total,
+            'pending': pending,
+            'tail': tail,
+        }
+        return total + pending
+
+
+def normalize_defensive(numbers):
+    if iter(numbers) is iter(numbers):
+        raise TypeError('Must supply a container')
+    if isinstance(numbers, CachedReadVisit):
+        total = numbers.total()
+    else:
+        total = sum(numbers)
+    result = []
+    for value in numbers:
+        percent = 100 * value / total
+        result.append(percent)
+    return result
+
+
+print('example 11')
+with TemporaryDirectory() as tmpdir:
+    log_path = os.path.join(tmpdir, 'visits.txt')
+    with open(log_path, 'w') as f:
+        f.write('15\n35\n80\n')
+    cached_visits = CachedReadVisit(log_path)
+    assert normalize_defensive(cached_visits) == percentages_6
+    print('first total:', cached_visits.total(), 'bytes read:', cached_visits.last_bytes_read)
+
+    with open(log_path, 'a') as f:
+        f.write('70\n')
+    print('after append:', cached_visits.total(), 'bytes read:', cached_visits.last_bytes_read)
+
+    with open(log_path, 'w') as f:
+        f.write('1\n2\n3\n4\n')
+    print('after rewrite:', cached_visits.total(), 'bytes read:', cached_visits.last_bytes_read)
+
+    with open(log_path, 'w') as f:
+        f.write('15\n35\n80') # 마지막 줄에 줄바꿈이 없음
+    assert cached_visits.total() == sum(cached_visits) == 130
+    assert normalize_defensive(cached_visits) == percentages_6
+    with open(log_path, 'a') as f:
+        f.write('0\n') # 마지막 줄 80 -> 800
+    assert cached_visits.total() == sum(cached_visits) == 850
+
+
+# example 12: 바이트 범위를 나눠 여러 프로세스에서 파싱/합산
+# 파일 크기를 parts개로 나눈 뒤 각 경계를 다음 줄의 시작으로 맞춤 -> 같은 파일이면 항상 같은 범위가 나옴
+# 합계는 정수 덧셈이고 퍼센트는 원소마다 100 * value / total 이므로 순차 실행과 결과가 정확히 같음
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+
+def split_byte_ranges(data_path, parts):
+    size = os.path.getsize(data_path)
+    bounds = [0]
+    with open(data_path, 'rb') as f:
+        for i in range(1, parts):
+            pos = size * i // parts
+            if pos <= bounds[-1]:
+                continue
+            f.seek(pos - 1)
+            f.readline() # pos - 1이 들어 있는 줄의 끝까지 건너뜀
+            if f.tell() < size:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def iter_range_values(data_path, start, end):
+    with open(data_path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            pos += len(line)
+            yield int(line)
+
+
+def sum_byte_range(data_path, start, end):
+    return sum(iter_range_values(data_path, start, end))
+
+
+def percent_byte_range(data_path, start, end, total):
+    return [100 * value / total for value in iter_range_values(data_path, start, end)]
+
+
+def parallel_visit_total(data_path, workers=None, parts=None, mp_context=None):
+    workers = workers or os.cpu_count()
+    ranges = split_byte_ranges(data_path, parts or workers * 4)
+    starts = [start for start, _ in ranges]
+    ends = [end for _, end in ranges]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        return sum(executor.map(sum_byte_range, repeat(data_path), starts, ends))
+
+
+def normalize_parallel(data_path, workers=None, parts=None, mp_context=None):
+    # 범위 순서대로 퍼센트 리스트를 하나씩 내보냄
+    # 동시에 제출하는 범위는 workers * 2개로 제한하므로 메모리에 올라가는 결과도 그만큼만 있음
+    # -> parts를 늘리면 범위 하나가 작아져서 한 번에 들고 있는 결과도 작아짐
+    workers = workers or os.cpu_count()
+    ranges = split_byte_ranges(data_path, parts or workers * 4)
+    starts = [start for start, _ in ranges]
+    ends = [end for _, end in ranges]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        total = sum(executor.map(sum_byte_range, repeat(data_path), starts, ends))
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(percent_byte_range, data_path, start, end, total))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# spawn/forkserver worker는 이 파일을 다시 import 하면서 example 1부터 모든 예제를 다시 실행함
+# 그래서 이 예제는 fork로만 돌리고 fork가 없는 플랫폼에서는 건너뜀 (함수만 가져다 쓸 때는 mp_context를 고르면 됨)
+if __name__ == '__main__' and 'fork' in multiprocessing.get_all_start_methods():
+    print('example 12')
+    fork = multiprocessing.get_context('fork')
+    with TemporaryDirectory() as tmpdir:
+        big_path = os.path.join(tmpdir, 'visits.txt')
+        with open(big_path, 'w') as f:
+            for i in range(100000):
+                f.write('%d\n' % (i * 7919 % 1000))
+        assert split_byte_ranges(big_path, 7) == split_byte_ranges(big_path, 7)
+        assert parallel_visit_total(big_path, workers=2, parts=7, mp_context=fork) == sum(ReadVisit(big_path))
+        percentages_12 = []
+        for percents in normalize_parallel(big_path, workers=2, parts=7, mp_context=fork):
+            percentages_12.extend(percents)
+        assert percentages_12 == normalize_defensive(ReadVisit(big_path))
+    print(len(percentages_12), 'percentages match the sequential path')
+
 print()
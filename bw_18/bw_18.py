@@ -55,4 +55,373 @@ print('example 5')
 log(1, 'Favorites', 7, 33)
 log('Favorite numbers', 7, 33) # 의도한 대로 동작하지 않음
 
+
+# example 6: 이터러블을 그대로 받는 lazy 로깅
+# *values로 받으면 제너레이터가 튜플로 다 만들어진 다음에야 출력됨
+# log_iter는 이터러블을 그대로 받고, 레벨이 꺼져 있으면 값을 하나도 꺼내지 않음
+# 켜져 있으면 chunk_size개씩만 문자열로 만들어 sink에 바로 씀 -> 큰 문자열 하나를 만들지 않음
+import sys
+from itertools import islice
+from logging import DEBUG, INFO
+
+log_level = INFO
+
+
+def log_iter(message, values=(), level=INFO, sink=None, chunk_size=1024):
+    if level < log_level:
+        return
+    sink = sys.stdout if sink is None else sink
+    it = iter(values)
+    chunk = list(islice(it, chunk_size))
+    if not chunk:
+        sink.write('%s\n' % message)
+        return
+    sink.write('%s: ' % message)
+    sink.write(','.join(str(x) for x in chunk))
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            break
+        sink.write(',')
+        sink.write(','.join(str(x) for x in chunk))
+    sink.write('\n')
+
+
+print('example 6')
+log_iter('My Numbers are', my_generator(), chunk_size=3)
+log_iter('Hi there')
+it = my_generator()
+log_iter('Debug numbers', it, level=DEBUG) # 꺼진 레벨: 이터레이터를 소비하지 않음
+assert next(it) == 0
+
+
+# example 7: 백그라운드 스레드에서 모아서 쓰는 로그 sink
+# print(..., file=sink)나 log_iter(..., sink=sink)에 넘기면 write는 큐에 넣기만 하고 바로 반환
+# 백그라운드 스레드가 flush_size개가 모이거나 flush_interval초가 지나면 한 번에 씀
+# 큐가 가득 차면 policy에 따라 block(호출한 쪽이 대기), drop_new(새 레코드 버림), drop_old(가장 오래된 레코드 버림)
+# sink를 받는 로거는 이 파일의 log_iter와 bw_20의 log_2. 예제 1~5의 log와 bw_20의 log_1은 문제를 보여 주는 예제라 그대로 둠
+# 락 없이 넣는 write가 close와 겹쳐 백그라운드 스레드가 끝난 뒤에 큐에 들어간 레코드는 close(또는 그 write)가 직접 씀
+import atexit
+import os
+from collections import deque
+from threading import Condition, Thread
+from time import perf_counter
+
+
+class BatchingSink(object):
+    policies = ('block', 'drop_new', 'drop_old')
+
+    def __init__(self, stream=None, flush_size=512, flush_interval=0.05, max_queue=65536, policy='block'):
+        if policy not in self.policies:
+            raise ValueError('Unknown policy %r' % policy)
+        self.stream = sys.stdout if stream is None else stream
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.policy = policy
+        self.dropped = 0
+        self._queue = deque()
+        self._cond = Condition()
+        self._closed = False
+        self._flush_requested = False
+        self._writing = False
+        self._error = None # 백그라운드 스레드에서 쓰기가 실패하면 그 예외를 write/flush/close에서 다시 발생
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, text):
+        # deque의 append/popleft는 스레드 안전하므로 큐에 여유가 있으면 락 없이 넣음
+        if self._error is not None:
+            raise self._error
+        if len(self._queue) < self.max_queue and not self._closed:
+            self._queue.append(text)
+            if self._closed: # 확인한 뒤 넣기 전에 close가 끼어들었으면 이미 끝난 스레드 대신 직접 씀
+                self._thread.join()
+                self._write_remaining()
+            elif len(self._queue) == self.flush_size:
+                with self._cond:
+                    self._cond.notify_all()
+            return len(text)
+        with self._cond:
+            if self._closed:
+                raise ValueError('write to closed sink')
+            while len(self._queue) >= self.max_queue:
+                if self.policy == 'drop_new':
+                    self.dropped += 1
+                    return len(text)
+                if self.policy == 'drop_old':
+                    self._queue.popleft()
+                    self.dropped += 1
+                    break
+                self._cond.wait()
+                if self._error is not None:
+                    raise self._error
+            self._queue.append(text)
+            if len(self._queue) >= self.flush_size:
+                self._cond.notify_all()
+        return len(text)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: len(self._queue) >= self.flush_size or self._closed or self._flush_requested,
+                    timeout=self.flush_interval)
+                batch = [self._queue.popleft() for _ in range(len(self._queue))]
+                self._flush_requested = False
+                self._writing = bool(batch)
+                closed = self._closed
+                self._cond.notify_all() # block 정책으로 대기 중인 write를 깨움
+            if batch:
+                try:
+                    self.stream.write(''.join(batch))
+                    self.stream.flush()
+                except Exception as e:
+                    with self._cond:
+                        self._error = e
+                        self._queue.clear() # 더 쓸 수 없으므로 남은 레코드는 버리고 대기 중인 쪽을 모두 깨움
+                    return
+                finally:
+                    with self._cond:
+                        self._writing = False
+                        self._cond.notify_all()
+            elif closed and not self._queue:
+                return
+
+    def _write_remaining(self):
+        with self._cond:
+            batch = [self._queue.popleft() for _ in range(len(self._queue))]
+            if batch and self._error is None:
+                self.stream.write(''.join(batch))
+                self.stream.flush()
+
+    def flush(self):
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._error is not None or (not self._queue and not self._writing))
+            if self._error is not None:
+                raise self._error
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self._error is not None:
+            raise self._error
+        self._write_remaining()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def benchmark_sinks(count=100000, path=os.devnull):
+    # 호출하는 쪽(hot path)에서 걸리는 시간 기준의 초당 호출 수
+    results = {}
+    with open(path, 'w') as f:
+        start = perf_counter()
+        for i in range(count):
+            print('%d: event' % i, file=f, flush=True)
+        results['print'] = count / (perf_counter() - start)
+    with open(path, 'w') as f:
+        sink = BatchingSink(f)
+        start = perf_counter()
+        for i in range(count):
+            print('%d: event' % i, file=sink)
+        results['batching'] = count / (perf_counter() - start)
+        sink.close()
+    return results
+
+
+print('example 7')
+with BatchingSink(flush_size=2) as sink:
+    log_iter('My Numbers are', my_generator(), sink=sink)
+    print('Hi there', file=sink)
+    sink.flush()
+for name, calls in benchmark_sinks(count=10000).items():
+    print('%s: %d calls/s' % (name, calls))
+
+
+# example 8: 시퀀스 번호 로그용 바이너리 링 버퍼
+# example 5의 log(sequence, message, *values)와 같은 시그니처로 기록하지만 문자열 포맷은 하지 않음
+# 시퀀스, 타임스탬프, 메시지 id(메시지 문자열은 한 번만 저장), 값들을 미리 할당한 배열에 덮어씀
+# 값은 double로 저장하고 int였는지는 비트마스크로 기억함 (2**53을 넘는 int는 정확히 저장할 수 없어 거부)
+# 숫자가 아닌 값은 메시지처럼 문자열 테이블에 한 번만 저장하고 id와 비트마스크로 기억함
+# 시퀀스와 모든 값을 먼저 검사하므로 거부된 이벤트는 슬롯도 문자열 테이블도 건드리지 않음
+# 문자열은 snapshot/dump_text/dump_binary를 호출할 때만 만듦
+import operator
+import struct
+from array import array
+from tempfile import TemporaryDirectory
+from time import time
+
+
+class EventRing(object):
+    magic = b'EVRING02'
+    header = struct.Struct('<8sQQQ') # magic, 이벤트 수, max_values, 문자열 수
+
+    def __init__(self, capacity=65536, max_values=4):
+        if not 0 <= max_values <= 16:
+            raise ValueError('max_values must be between 0 and 16')
+        self.capacity = capacity
+        self.max_values = max_values
+        self.count = 0 # 지금까지 기록된 전체 이벤트 수
+        self._seq = array('q', bytes(8 * capacity))
+        self._time = array('d', bytes(8 * capacity))
+        self._msg = array('q', bytes(8 * capacity))
+        self._nvalues = array('B', bytes(capacity))
+        self._int_mask = array('H', bytes(2 * capacity))
+        self._obj_mask = array('H', bytes(2 * capacity))
+        self._values = array('d', bytes(8 * capacity * max_values))
+        self._messages = [] # 메시지와 숫자가 아닌 값을 함께 담는 문자열 테이블
+        self._message_ids = {}
+
+    def _intern(self, text):
+        text_id = self._message_ids.get(text)
+        if text_id is None:
+            text_id = self._message_ids[text] = len(self._messages)
+            self._messages.append(text)
+        return text_id
+
+    def log(self, sequence, message, *values):
+        if len(values) > self.max_values:
+            raise ValueError('At most %d values per event' % self.max_values)
+        sequence = operator.index(sequence) # 정수가 아니면 TypeError (log('Favorite numbers', 7, 33) 같은 실수)
+        if not -2**63 <= sequence < 2**63:
+            raise ValueError('Sequence %d does not fit in int64' % sequence)
+        hash(message) # intern할 수 없는 메시지도 쓰기 전에 거부
+        int_mask = obj_mask = 0
+        encoded = []
+        for j, value in enumerate(values):
+            if isinstance(value, int):
+                if not -2**53 <= value <= 2**53:
+                    raise ValueError('%d cannot be stored exactly' % value)
+                int_mask |= 1 << j
+            elif not isinstance(value, float):
+                obj_mask |= 1 << j
+                encoded.append(None) # 검사가 끝난 뒤에 intern 함
+                continue
+            encoded.append(value)
+        message_id = self._intern(message)
+        for j, value in enumerate(values):
+            if obj_mask & (1 << j):
+                encoded[j] = self._intern(str(value))
+        i = self.count % self.capacity
+        base = i * self.max_values
+        self._values[base:base + len(encoded)] = array('d', encoded)
+        self._seq[i] = sequence
+        self._time[i] = time()
+        self._msg[i] = message_id
+        self._nvalues[i] = len(values)
+        self._int_mask[i] = int_mask
+        self._obj_mask[i] = obj_mask
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def _indexes(self, n=None):
+        # 오래된 것부터 최근 n개 슬롯의 인덱스
+        size = len(self) if n is None else min(n, len(self))
+        first = self.count - size
+        return [k % self.capacity for k in range(first, self.count)]
+
+    def _event_values(self, i):
+        base = i * self.max_values
+        int_mask = self._int_mask[i]
+        obj_mask = self._obj_mask[i]
+        values = []
+        for j in range(self._nvalues[i]):
+            value = self._values[base + j]
+            if obj_mask & (1 << j):
+                values.append(self._messages[int(value)])
+            else:
+                values.append(int(value) if int_mask & (1 << j) else value)
+        return tuple(values)
+
+    def snapshot(self, n=None):
+        return [(self._seq[i], self._time[i], self._messages[self._msg[i]], self._event_values(i))
+                for i in self._indexes(n)]
+
+    def dump_text(self, n=None, stream=None):
+        stream = sys.stdout if stream is None else stream
+        for sequence, when, message, values in self.snapshot(n):
+            if not values:
+                stream.write('%.6f %s: %s\n' % (when, sequence, message))
+            else:
+                values_str = ','.join(str(x) for x in values)
+                stream.write('%.6f %s: %s: %s\n' % (when, sequence, message, values_str))
+
+    def dump_binary(self, path, n=None):
+        indexes = self._indexes(n)
+        columns = [array(a.typecode, (a[i] for i in indexes))
+                   for a in (self._seq, self._time, self._msg, self._nvalues, self._int_mask, self._obj_mask)]
+        values = array('d')
+        for i in indexes:
+            base = i * self.max_values
+            values.extend(self._values[base:base + self.max_values])
+        with open(path, 'wb') as f:
+            f.write(self.header.pack(self.magic, len(indexes), self.max_values, len(self._messages)))
+            for message in self._messages:
+                data = str(message).encode('utf-8')
+                f.write(struct.pack('<I', len(data)))
+                f.write(data)
+            for column in columns + [values]:
+                column.tofile(f)
+
+    @classmethod
+    def load_binary(cls, path):
+        with open(path, 'rb') as f:
+            magic, count, max_values, message_count = cls.header.unpack(f.read(cls.header.size))
+            if magic != cls.magic:
+                raise ValueError('%s is not an EventRing dump' % path)
+            ring = cls(capacity=max(count, 1), max_values=max_values)
+            for _ in range(message_count):
+                size, = struct.unpack('<I', f.read(4))
+                message = f.read(size).decode('utf-8')
+                ring._message_ids[message] = len(ring._messages)
+                ring._messages.append(message)
+            for name, typecode, length in (('_seq', 'q', count), ('_time', 'd', count),
+                                           ('_msg', 'q', count), ('_nvalues', 'B', count),
+                                           ('_int_mask', 'H', count), ('_obj_mask', 'H', count),
+                                           ('_values', 'd', count * max_values)):
+                column = array(typecode)
+                column.fromfile(f, length)
+                getattr(ring, name)[:length] = column
+            ring.count = count
+        return ring
+
+
+print('example 8')
+ring = EventRing(capacity=3, max_values=2)
+ring.log(1, 'Favorites', 7, 33)
+ring.log(2, 'Hi there')
+ring.log(3, 'Favorites', 1.5, 2)
+ring.log(4, 'Favorites', 8, 'blue')
+before = ring.snapshot()
+message_count = len(ring._messages)
+for args in ((5, 'Favorites', 1, 2**60), ('Favorite numbers', 7, 33), (2**63, 'Overflow'), (6, ['unhashable'])):
+    try:
+        ring.log(*args)
+    except (TypeError, ValueError):
+        pass
+    else:
+        assert False, args
+assert ring.snapshot() == before and len(ring._messages) == message_count # 거부된 이벤트는 아무것도 바꾸지 않음
+print([event[0] for event in ring.snapshot()]) # 가장 오래된 1번은 덮어써짐
+ring.dump_text(n=2)
+with TemporaryDirectory() as tmpdir:
+    dump_path = os.path.join(tmpdir, 'events.bin')
+    ring.dump_binary(dump_path)
+    loaded = EventRing.load_binary(dump_path)
+assert loaded.snapshot() == ring.snapshot()
+
 print()
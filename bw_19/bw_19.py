@@ -32,4 +32,125 @@ def flow_rate_2(weight_diff, time_diff, period=1, units_per_kg: float = 1):
 
 
 pounds_per_hour = flow_rate_2(weight_diff, time_diff, period=3600, units_per_kg=2.2)
+
+
+# 측정값 배열을 한 번에 계산하는 batch 버전
+# period, units_per_kg는 스칼라 또는 원소별 배열 모두 가능
+# 0으로 나누는 원소는 예외 대신 mask로 표시하고 결과는 nan
+# NumPy가 없으면 같은 결과를 리스트로 돌려줌
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _as_list(value, size):
+    if isinstance(value, (int, float)):
+        return [value] * size
+    value = list(value)
+    if len(value) != size:
+        raise ValueError('Expected %d values, got %d' % (size, len(value)))
+    return value
+
+
+def flow_rate_2_batch(weight_diffs, time_diffs, period=1, units_per_kg=1):
+    if np is None:
+        weight_diffs = list(weight_diffs)
+        size = len(weight_diffs)
+        rates, mask = [], []
+        for weight, time, per, units in zip(weight_diffs, _as_list(time_diffs, size),
+                                           _as_list(period, size), _as_list(units_per_kg, size)):
+            invalid = time == 0 or units == 0
+            mask.append(invalid)
+            rates.append(float('nan') if invalid else ((weight / units) / time) * per)
+        return rates, mask
+    weight = np.asarray(weight_diffs, dtype=np.float64)
+    time = np.asarray(time_diffs, dtype=np.float64)
+    units = np.asarray(units_per_kg, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = ((weight / units) / time) * np.asarray(period, dtype=np.float64)
+    mask = np.broadcast_to((time == 0) | (units == 0), rates.shape)
+    rates[mask] = np.nan
+    return rates, mask
+
+
+def flow_rate_batch(weight_diffs, time_diffs, period=1):
+    return flow_rate_2_batch(weight_diffs, time_diffs, period=period)
+
+
+def benchmark_flow_rate(size=10**6):
+    weight_diffs = [(i % 100) / 10 for i in range(size)]
+    time_diffs = [i % 7 for i in range(size)]
+    start = perf_counter()
+    for weight, time in zip(weight_diffs, time_diffs):
+        try:
+            flow_rate_2(weight, time, period=3600, units_per_kg=2.2)
+        except ZeroDivisionError:
+            pass
+    scalar = size / (perf_counter() - start)
+    start = perf_counter()
+    flow_rate_2_batch(weight_diffs, time_diffs, period=3600, units_per_kg=2.2)
+    batch = size / (perf_counter() - start)
+    return {'scalar': scalar, 'batch': batch}
+
+
+rates, mask = flow_rate_2_batch([0.5, 1.0, 2.0], [3, 0, 4], period=3600, units_per_kg=[2.2, 2.2, 1])
+assert rates[0] == pounds_per_hour
+assert list(mask) == [False, True, False]
+print([bool(invalid) for invalid in mask], [float(rate) for rate in rates])
+for name, rate in benchmark_flow_rate(size=10**4).items():
+    print('%s: %d samples/s' % (name, rate))
+
+
+# (timestamp, weight) 측정값을 흘려 넣으면 슬라이딩 윈도우의 flow rate를 바로 계산하는 스트리밍 계산기
+# 윈도우의 가장 오래된 값과 최신 값의 차이로 flow_rate_2를 호출하므로 샘플당 O(1) (popleft는 amortized)
+# window_seconds(시간 기준) 또는 window_count(샘플 개수 기준) 중 하나를 지정
+# 시간 기준 윈도우도 max_samples로 보관 개수를 제한할 수 있음
+from collections import deque
+
+
+class RollingFlowRate(object):
+    def __init__(self, window_seconds=None, window_count=None, period=1, units_per_kg=1, max_samples=None):
+        if (window_seconds is None) == (window_count is None):
+            raise ValueError('Specify exactly one of window_seconds or window_count')
+        if window_count is not None:
+            max_samples = window_count + 1 # 차이 window_count개 = 샘플 window_count + 1개
+        self.window_seconds = window_seconds
+        self.period = period
+        self.units_per_kg = units_per_kg
+        self._readings = deque(maxlen=max_samples)
+
+    def add(self, timestamp, weight):
+        readings = self._readings
+        if readings and timestamp < readings[-1][0]:
+            raise ValueError('Timestamps must not go backwards')
+        readings.append((timestamp, weight))
+        if self.window_seconds is not None:
+            start = timestamp - self.window_seconds
+            while readings[0][0] < start:
+                readings.popleft()
+        return self.rate()
+
+    def rate(self):
+        if len(self._readings) < 2:
+            return None
+        first_time, first_weight = self._readings[0]
+        last_time, last_weight = self._readings[-1]
+        if last_time == first_time:
+            return None
+        return flow_rate_2(last_weight - first_weight, last_time - first_time,
+                           period=self.period, units_per_kg=self.units_per_kg)
+
+    def feed(self, readings):
+        for timestamp, weight in readings:
+            yield timestamp, self.add(timestamp, weight)
+
+
+readings = [(0, 0.0), (1, 0.5), (2, 1.5), (3, 1.5), (4, 2.0)]
+by_count = RollingFlowRate(window_count=2, period=3600, units_per_kg=2.2)
+print([rate for _, rate in by_count.feed(readings)])
+by_time = RollingFlowRate(window_seconds=2)
+print([rate for _, rate in by_time.feed(readings)])
 print()
\ No newline at end of file
@@ -33,6 +33,19 @@ log_2('Hi there!')
 print('\n')
 
 
+def log_2(message, when=None, sink=None):
+    """
+    Log a message with a timestamp.
+
+    :param message: Message to print
+    :param when: datetime of when the message ocurred. Defaults to the present time.
+    :param sink: File-like object to write to, e.g. bw_18's BatchingSink. Defaults to sys.stdout.
+    :return: None
+    """
+    when = datetime.now() if when is None else when
+    print('%s %s' % (when, message), file=sink)
+
+
 def decode(data, default={}):
     try:
         return json.loads(data)
@@ -70,4 +83,302 @@ bar_2 = decode_2('also bad')
 bar_2['meep'] = 1
 print('Foo 2:', foo_2)
 print('Bar 2:', bar_2)
+
+
+# NDJSON(줄마다 JSON 하나)을 chunk 단위로 프로세스 풀에서 decode
+# decode_2처럼 잘못된 줄은 기본값으로 바꾸되, 기본값은 부모 프로세스에서 default_factory()로 매번 새로 만듦
+# chunk마다 레코드 수, 바이트 수, 오류 수를 기록하고 전체 초당 레코드/바이트 수를 계산
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+from time import perf_counter
+
+
+class DecodeStats(object):
+    def __init__(self):
+        self.chunks = [] # (records, bytes, errors)
+        self.records = 0
+        self.bytes = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def add_chunk(self, records, nbytes, errors):
+        self.chunks.append((records, nbytes, errors))
+        self.records += records
+        self.bytes += nbytes
+        self.errors += errors
+
+    @property
+    def records_per_second(self):
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+
+def decode_chunk(lines):
+    results, errors, nbytes = [], [], 0
+    for i, line in enumerate(lines):
+        nbytes += len(line.encode('utf-8')) if isinstance(line, str) else len(line)
+        try:
+            results.append(json.loads(line))
+        except ValueError:
+            results.append(None) # json.loads('null')도 None이므로 오류 위치는 errors로 따로 넘김
+            errors.append(i)
+    return results, errors, nbytes
+
+
+def iter_chunks(lines, chunk_size):
+    it = iter(lines)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_decode(source, chunk_size=10000, workers=None, default_factory=dict, stats=None, mp_context=None):
+    """
+    Decode NDJSON payloads in order using a process pool.
+
+    :param source: Path to an NDJSON file, or an iterable of lines (str or bytes)
+    :param chunk_size: Number of lines sent to a worker at once
+    :param workers: Number of worker processes. Defaults to os.cpu_count()
+    :param default_factory: Called once per bad line to build its replacement value
+    :param stats: DecodeStats to fill in while decoding
+    :param mp_context: multiprocessing context for the pool (e.g. get_context('fork'))
+    :return: Generator of decoded values
+    """
+    stats = DecodeStats() if stats is None else stats
+    workers = workers or os.cpu_count()
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        with (open(source, 'rb') if isinstance(source, str) else nullcontext(source)) as lines:
+            pending = deque()
+            for chunk in iter_chunks(lines, chunk_size):
+                pending.append(executor.submit(decode_chunk, chunk))
+                if len(pending) < workers * 2: # 결과를 순서대로 내보내면서 메모리에 올라간 chunk 수를 제한
+                    continue
+                yield from _finish_chunk(pending.popleft(), default_factory, stats, start)
+            while pending:
+                yield from _finish_chunk(pending.popleft(), default_factory, stats, start)
+
+
+def _finish_chunk(future, default_factory, stats, start):
+    results, errors, nbytes = future.result()
+    for i in errors:
+        results[i] = default_factory()
+    stats.add_chunk(len(results), nbytes, len(errors))
+    stats.elapsed = perf_counter() - start
+    return results
+
+
+# 이 파일은 예제를 모듈 수준에서 실행하므로 spawn/forkserver worker가 import 하면 앞의 예제가 worker마다 다시 돎
+# 예제는 fork context로만 실행하고, fork를 지원하지 않는 플랫폼에서는 생략
+if __name__ == '__main__' and 'fork' in multiprocessing.get_all_start_methods():
+    payloads = ['{"id": %d}' % i if i % 5 else 'bad data' for i in range(1000)]
+    decode_stats = DecodeStats()
+    decoded = list(bulk_decode(payloads, chunk_size=64, workers=2, stats=decode_stats,
+                               mp_context=multiprocessing.get_context('fork')))
+    assert decoded == [decode_2(payload) for payload in payloads]
+    assert decoded[0] is not decoded[5] # 잘못된 줄마다 새로운 기본값
+    print('records: %d, errors: %d, chunks: %d' % (decode_stats.records, decode_stats.errors, len(decode_stats.chunks)))
+    print('%.0f records/s, %.0f bytes/s' % (decode_stats.records_per_second, decode_stats.bytes_per_second))
+
+
+# 반복되는 payload를 위한 LRU decode 캐시 (opt-in)
+# decode의 예처럼 공유되는 가변 반환값은 위험하므로 캐시 값은 그대로 내주지 않음
+#   frozen=True: dict -> MappingProxyType, list -> tuple로 얼려서 공유 (읽기 전용)
+#   frozen=False: 캐시 hit마다 새로운 dict/list 복사본을 돌려줌
+# 크기 제한은 payload 길이 + 디코딩한 객체의 sys.getsizeof 합으로 추정한 바이트 수
+import sys
+from collections import OrderedDict
+from types import MappingProxyType
+
+_decode_failed = object()
+
+
+def freeze_json(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze_json(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze_json(item) for item in value)
+    return value
+
+
+def copy_json(value):
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
+
+
+def json_size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(key) + json_size(item) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(json_size(item) for item in value)
+    return size
+
+
+class DecodeCache(object):
+    def __init__(self, max_bytes=64 * 1024 * 1024, frozen=True):
+        self.max_bytes = max_bytes
+        self.frozen = frozen
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # payload -> (value, size)
+
+    def decode(self, data, default=None):
+        """
+        Load JSON data from a string, reusing the result of an identical earlier payload.
+
+        :param data: JSON data to decode
+        :param default: Value to return if decoding fails. Defaults to a new empty dictionary
+        :return: Decoded value, frozen or copied so callers can't corrupt the cache
+        """
+        entry = self._entries.get(data)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(data)
+            value = entry[0]
+        else:
+            self.misses += 1
+            size = sys.getsizeof(data)
+            try:
+                value = json.loads(data)
+            except ValueError:
+                value = _decode_failed
+            else:
+                size += json_size(value)
+                if self.frozen:
+                    value = freeze_json(value)
+            self._insert(data, value, size)
+        if value is _decode_failed:
+            return {} if default is None else default
+        return value if self.frozen else copy_json(value)
+
+    def _insert(self, data, value, size):
+        if size > self.max_bytes:
+            return
+        self._entries[data] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+cache = DecodeCache(max_bytes=4096)
+foo_3 = cache.decode('{"stuff": [1, 2]}')
+try:
+    foo_3['stuff'] = 5
+except TypeError:
+    print('cached results are read-only')
+bar_3 = cache.decode('bad data')
+bar_3['meep'] = 1
+assert cache.decode('bad data') == {}
+copy_cache = DecodeCache(frozen=False)
+copy_cache.decode('{"stuff": [1, 2]}')['stuff'].append(3)
+assert copy_cache.decode('{"stuff": [1, 2]}') == {'stuff': [1, 2]}
+print(cache.decode('{"stuff": [1, 2]}') == {'stuff': (1, 2)}, cache.stats())
+
+
+# log_2용 저비용 타임스탬프
+# datetime.now()와 문자열 변환을 매번 하지 않고, resolution초마다 한 번만 갱신한 값을 재사용
+#   background=False: 호출할 때 monotonic()만 확인하고 resolution이 지났을 때만 다시 만듦
+#   (만료 시각은 monotonic 기준이라 벽시계가 NTP 등으로 뒤로 돌아가도 캐시된 시각이 멈추지 않음)
+#   background=True: 백그라운드 스레드가 resolution마다 갱신하고 호출하는 쪽은 속성만 읽음
+# log_2의 clock 인자로 호출마다 정밀 시각(clock=None)과 저비용 시각을 고를 수 있음
+from threading import Event, Thread
+from time import monotonic
+
+
+class CoarseClock(object):
+    def __init__(self, resolution=0.001, background=False):
+        self.resolution = resolution
+        self._refresh()
+        self._stop = None
+        if background:
+            self._stop = Event()
+            Thread(target=self._run, daemon=True).start()
+
+    def _refresh(self):
+        self._when = datetime.now()
+        self._text = str(self._when)
+        self._expires = monotonic() + self.resolution
+
+    def _run(self):
+        while not self._stop.wait(self.resolution):
+            self._refresh()
+
+    def now(self):
+        if self._stop is None and monotonic() >= self._expires:
+            self._refresh()
+        return self._when
+
+    def now_str(self):
+        if self._stop is None and monotonic() >= self._expires:
+            self._refresh()
+        return self._text
+
+    def close(self):
+        if self._stop is not None:
+            self._stop.set()
+
+
+def log_2(message, when=None, sink=None, clock=None):
+    """
+    Log a message with a timestamp.
+
+    :param message: Message to print
+    :param when: datetime of when the message ocurred. Defaults to the present time.
+    :param sink: File-like object to write to, e.g. bw_18's BatchingSink. Defaults to sys.stdout.
+    :param clock: CoarseClock to read the present time from. Defaults to datetime.now().
+    :return: None
+    """
+    if when is None:
+        when = datetime.now() if clock is None else clock.now_str()
+    print('%s %s' % (when, message), file=sink)
+
+
+def benchmark_clocks(count=10**6):
+    results = {}
+    start = perf_counter()
+    for _ in range(count):
+        str(datetime.now())
+    results['datetime.now'] = count / (perf_counter() - start)
+    for name, clock in (('coarse', CoarseClock()), ('coarse background', CoarseClock(background=True))):
+        start = perf_counter()
+        for _ in range(count):
+            clock.now_str()
+        results[name] = count / (perf_counter() - start)
+        clock.close()
+    return results
+
+
+coarse_clock = CoarseClock(resolution=0.01)
+log_2('Hi there!', clock=coarse_clock)
+log_2('Hi there!')
+for name, calls in benchmark_clocks(count=10**5).items():
+    print('%s: %d calls/s' % (name, calls))
 print()
\ No newline at end of file
@@ -56,3 +56,188 @@ def safe_division_c(number, divisor, *, ignore_overflow=False, ignore_zero_divis
 
 result_4 = safe_division_c(1, 0, ignore_zero_division=True)
 print(result_4)
+
+
+# 배열 단위 safe_division_c
+# 원소마다 safe_division_c와 같은 결과: 0으로 나누면 inf(ignore_zero_division), float로 바꿀 수 없는 큰 int는 0(ignore_overflow)
+# 정책이 꺼져 있으면 처음 문제가 된 원소의 index를 담아 같은 종류의 예외를 발생
+# NumPy가 있고 모든 값이 float64로 정확히 표현되면 mask로 한 번에 계산, 아니면 원소별 루프
+# 결과와 함께 각 정책에 걸린 원소 수를 돌려줌
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _as_float_array(values):
+    converted = np.asarray(values)
+    if converted.dtype.kind == 'f':
+        return converted
+    if converted.dtype.kind in 'iub' and (converted.size == 0 or np.abs(converted).max() <= 2**53):
+        return converted.astype(np.float64)
+    return None # 큰 int(object dtype) 등은 원소별 루프에서 처리
+
+
+def _safe_division_loop(numbers, divisors, ignore_overflow, ignore_zero_division, index_offset=0):
+    results = []
+    counts = {'overflow': 0, 'zero_division': 0}
+    for i, (number, divisor) in enumerate(zip(numbers, divisors)):
+        try:
+            results.append(number / divisor)
+        except OverflowError as e:
+            if not ignore_overflow:
+                raise OverflowError('%s at index %d' % (e, index_offset + i)) from e
+            results.append(0)
+            counts['overflow'] += 1
+        except ZeroDivisionError as e:
+            if not ignore_zero_division:
+                raise ZeroDivisionError('%s at index %d' % (e, index_offset + i)) from e
+            results.append(float('inf'))
+            counts['zero_division'] += 1
+    return results, counts
+
+
+def safe_division_array(numbers, divisors, *, ignore_overflow=False, ignore_zero_division=False, index_offset=0):
+    # array('d'), NumPy 배열, 리스트는 그대로 np.asarray에 넘기고 길이를 모르는 iterable만 리스트로 만듦
+    if not hasattr(numbers, '__len__'):
+        numbers = list(numbers)
+    if not hasattr(divisors, '__len__'):
+        divisors = list(divisors)
+    if len(numbers) != len(divisors):
+        raise ValueError('numbers and divisors must have the same length')
+    if np is not None:
+        number_array = _as_float_array(numbers)
+        divisor_array = _as_float_array(divisors)
+        if number_array is not None and divisor_array is not None:
+            zero = divisor_array == 0
+            zero_count = int(zero.sum())
+            if zero_count and not ignore_zero_division:
+                raise ZeroDivisionError('division by zero at index %d' % (index_offset + int(zero.argmax())))
+            with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                results = number_array / divisor_array
+            results[zero] = np.inf
+            return results, {'overflow': 0, 'zero_division': zero_count}
+    return _safe_division_loop(numbers, divisors, ignore_overflow, ignore_zero_division, index_offset)
+
+
+numbers = [1, 10**500, 3, 4.5]
+divisors = [10, 1, 0, 0.5]
+result_5, counts = safe_division_array(numbers, divisors, ignore_overflow=True, ignore_zero_division=True)
+assert list(result_5) == [safe_division_c(n, d, ignore_overflow=True, ignore_zero_division=True)
+                          for n, d in zip(numbers, divisors)]
+print(list(result_5), counts)
+
+result_6, counts = safe_division_array([1, 2, 3], [4, 0, 0], ignore_zero_division=True)
+print([float(x) for x in result_6], counts)
+try:
+    safe_division_array([1, 2, 3], [4, 0, 0])
+except ZeroDivisionError as e:
+    print(e)
+
+
+# 메모리보다 큰 두 컬럼 파일(분자, 분모)을 같은 크기의 chunk로 나란히 읽어 safe_division_array를 적용
+# 입력은 text(한 줄에 숫자 하나), f8(float64), i8(int64) 바이너리, 출력은 text 또는 f8
+# chunk 하나만 메모리에 올리므로 메모리는 chunk_size에 비례. 단계(read, divide, write)별 초당 행 수를 기록
+from array import array
+from itertools import islice
+from time import perf_counter
+
+
+class RatioStats(object):
+    stages = ('read', 'divide', 'write')
+
+    def __init__(self):
+        self.rows = 0
+        self.seconds = dict.fromkeys(self.stages, 0.0)
+        self.counts = {'overflow': 0, 'zero_division': 0}
+
+    def rows_per_second(self):
+        return {stage: self.rows / seconds if seconds else 0.0 for stage, seconds in self.seconds.items()}
+
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def iter_column_chunks(path, chunk_size, fmt='text'):
+    if fmt == 'text':
+        with open(path, 'rb') as f:
+            while True:
+                chunk = [parse_number(line) for line in islice(f, chunk_size)]
+                if not chunk:
+                    return
+                yield chunk
+    typecode = {'f8': 'd', 'i8': 'q'}[fmt]
+    with open(path, 'rb') as f:
+        while True:
+            chunk = array(typecode)
+            try:
+                chunk.fromfile(f, chunk_size)
+            except EOFError:
+                pass
+            if not chunk:
+                return
+            yield chunk
+
+
+def divide_columns(number_path, divisor_path, out_path, *, chunk_size=65536, input_format='text',
+                   output_format='text', ignore_overflow=False, ignore_zero_division=False):
+    stats = RatioStats()
+    numbers = iter_column_chunks(number_path, chunk_size, input_format)
+    divisors = iter_column_chunks(divisor_path, chunk_size, input_format)
+    with open(out_path, 'w' if output_format == 'text' else 'wb') as out:
+        while True:
+            start = perf_counter()
+            number_chunk = next(numbers, None)
+            divisor_chunk = next(divisors, None)
+            stats.seconds['read'] += perf_counter() - start
+            if number_chunk is None and divisor_chunk is None:
+                break
+            if number_chunk is None or divisor_chunk is None or len(number_chunk) != len(divisor_chunk):
+                raise ValueError('Columns have different lengths (after row %d)' % stats.rows)
+
+            start = perf_counter()
+            results, counts = safe_division_array(number_chunk, divisor_chunk, ignore_overflow=ignore_overflow,
+                                                  ignore_zero_division=ignore_zero_division,
+                                                  index_offset=stats.rows)
+            stats.seconds['divide'] += perf_counter() - start
+
+            start = perf_counter()
+            if output_format == 'text':
+                out.write(''.join('%r\n' % float(result) for result in results))
+            else:
+                array('d', results).tofile(out)
+            stats.seconds['write'] += perf_counter() - start
+
+            stats.rows += len(number_chunk)
+            for key, count in counts.items():
+                stats.counts[key] += count
+    return stats
+
+
+from tempfile import TemporaryDirectory
+import os
+
+with TemporaryDirectory() as tmpdir:
+    number_path = os.path.join(tmpdir, 'numbers.txt')
+    divisor_path = os.path.join(tmpdir, 'divisors.txt')
+    out_path = os.path.join(tmpdir, 'ratios.bin')
+    with open(number_path, 'w') as f:
+        f.write(''.join('%d\n' % i for i in range(1000)))
+    with open(divisor_path, 'w') as f:
+        f.write(''.join('%d\n' % (i % 10) for i in range(1000)))
+    ratio_stats = divide_columns(number_path, divisor_path, out_path, chunk_size=128,
+                                 output_format='f8', ignore_zero_division=True)
+    ratios = array('d')
+    with open(out_path, 'rb') as f:
+        ratios.fromfile(f, ratio_stats.rows)
+    assert ratios[11] == 11 / 1 and ratios[10] == float('inf')
+    try:
+        divide_columns(number_path, divisor_path, out_path, chunk_size=128)
+    except ZeroDivisionError as e:
+        print(e)
+print(ratio_stats.rows, ratio_stats.counts)
+print(dict((stage, int(rate)) for stage, rate in ratio_stats.rows_per_second().items()))
@@ -10,6 +10,9 @@ class SimpleGradeBook(object):
     def report_grade(self, name, score):
         self._grades[name].append(score)
 
+    def report_grades(self, name, scores):
+        self._grades[name].extend(scores)
+
     def average_grade(self, name):
         grades = self._grades[name]
         return sum(grades) / len(grades)
@@ -34,6 +37,9 @@ class BySubjectGradebook(object):
         grade_list = by_subject.setdefault(subject, [])
         grade_list.append(score)
 
+    def report_grades(self, name, subject, scores):
+        self._grades[name].setdefault(subject, []).extend(scores)
+
     def average_grade(self, name):
         by_subject = self._grades[name]
         total, count = 0, 0
@@ -65,6 +71,9 @@ class WeightedGradebook(object):
         grade_list = by_subject.setdefault(subject, [])
         grade_list.append((score, weight))
 
+    def report_grades(self, name, subject, grades):
+        self._grades[name].setdefault(subject, []).extend(grades)
+
     def average_grade(self, name):
         by_subject = self._grades[name]
         score_sum, subject_count = 0, 0
@@ -127,6 +136,9 @@ class Subject(object):
     def report_grade(self, score, weight):
         self._grades.append(Grade(score, weight))
 
+    def report_grades(self, grades):
+        self._grades.extend(Grade(score, weight) for score, weight in grades)
+
     def average_grade(self):
         total, total_weight = 0, 0
         for grade in self._grades:
@@ -174,24 +186,1475 @@ gym.report_grade(85, 0.60)
 print(albert.average_grade())
 
 
+# 컬럼 방식(array 기반) Gradebook
+# 성적 하나마다 Grade namedtuple을 만드는 대신 학생/과목 이름은 정수 id로 intern하고
+# 학생 id, 과목 id, 점수, 가중치를 타입이 고정된 array 4개에 나란히 저장 (성적당 24바이트)
+# book.student(name).subject(name).report_grade(...) 사용법은 Gradebook과 같음
+# student(), subject()는 id만 들고 있는 가벼운 view 객체를 돌려줌
+# 평균 조회가 전체 컬럼을 훑지 않도록 (학생, 과목)마다 가중 점수 합계와 가중치 합계를 따로 유지
+from array import array
+import tracemalloc
+
+
+class ColumnarSubject(object):
+    __slots__ = ('_book', '_student_id', '_subject_id')
+
+    def __init__(self, book, student_id, subject_id):
+        self._book = book
+        self._student_id = student_id
+        self._subject_id = subject_id
+
+    def report_grade(self, score, weight):
+        self._book._append(self._student_id, self._subject_id, score, weight)
+
+    def report_grades(self, grades):
+        self._book._extend(self._student_id, self._subject_id, grades)
+
+    def average_grade(self):
+        total, total_weight = self._book._sums[self._student_id][self._subject_id]
+        return total / total_weight
+
+
+class ColumnarStudent(object):
+    __slots__ = ('_book', '_student_id')
+
+    def __init__(self, book, student_id):
+        self._book = book
+        self._student_id = student_id
+
+    def subject(self, name):
+        return ColumnarSubject(self._book, self._student_id, self._book._intern_subject(name))
+
+    def average_grade(self):
+        total, count = 0, 0
+        for subject_total, subject_weight in self._book._sums[self._student_id].values():
+            total += subject_total / subject_weight
+            count += 1
+        return total / count
+
+
+class ColumnarGradebook(object):
+    def __init__(self):
+        self._student_ids = {}
+        self._student_names = []
+        self._subject_ids = {}
+        self._subject_names = []
+        self._student = array('i')
+        self._subject = array('i')
+        self._score = array('d')
+        self._weight = array('d')
+        self._sums = [] # 학생 id -> {과목 id: [total, total_weight]}
+
+    def _intern_student(self, name):
+        student_id = self._student_ids.get(name)
+        if student_id is None:
+            student_id = self._student_ids[name] = len(self._student_names)
+            self._student_names.append(name)
+            self._sums.append({})
+        return student_id
+
+    def _intern_subject(self, name):
+        subject_id = self._subject_ids.get(name)
+        if subject_id is None:
+            subject_id = self._subject_ids[name] = len(self._subject_names)
+            self._subject_names.append(name)
+        return subject_id
+
+    def _append(self, student_id, subject_id, score, weight):
+        self._student.append(student_id)
+        self._subject.append(subject_id)
+        self._score.append(score)
+        self._weight.append(weight)
+        sums = self._sums[student_id].setdefault(subject_id, [0, 0])
+        sums[0] += score * weight
+        sums[1] += weight
+
+    def _extend(self, student_id, subject_id, grades):
+        self._student.extend([student_id] * len(grades))
+        self._subject.extend([subject_id] * len(grades))
+        self._score.extend(score for score, _ in grades)
+        self._weight.extend(weight for _, weight in grades)
+        sums = self._sums[student_id].setdefault(subject_id, [0, 0])
+        for score, weight in grades:
+            sums[0] += score * weight
+            sums[1] += weight
+
+    def student(self, name):
+        return ColumnarStudent(self, self._intern_student(name))
+
+    def __len__(self):
+        return len(self._score)
+
+
+def synthetic_grades(count, students=None, subjects=('Math', 'Gym', 'Science', 'History', 'Art')):
+    # (학생 이름, 과목, 점수, 가중치)를 count개 만드는 결정적인 워크로드
+    students = students or max(1, count // 100)
+    for i in range(count):
+        yield ('Student %d' % (i % students), subjects[(i // students) % len(subjects)],
+               50 + (i * 37) % 51, ((i * 13) % 10 + 1) / 10)
+
+
+def measure_memory(factory, count):
+    tracemalloc.start()
+    try:
+        book = factory()
+        for name, subject, score, weight in synthetic_grades(count):
+            book.student(name).subject(subject).report_grade(score, weight)
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current / count
+
+
+def compare_gradebook_memory(count=10**7):
+    return {factory.__name__: measure_memory(factory, count) for factory in (Gradebook, ColumnarGradebook)}
+
+
+book = ColumnarGradebook()
+albert = book.student('Albert Einstein')
+math = albert.subject('Math')
+math.report_grade(80, 0.1)
+math.report_grade(80, 0.10)
+math.report_grade(70, 0.80)
+gym = albert.subject('Gym')
+gym.report_grade(100, 0.40)
+gym.report_grade(85, 0.60)
+print(albert.average_grade())
 
+# 전체 비교는 compare_gradebook_memory(10**7)
+for name, bytes_per_grade in compare_gradebook_memory(count=10**4).items():
+    print('%s: %.1f bytes per grade' % (name, bytes_per_grade))
 
 
+# O(1) 평균: report_grade에서 가중치 합계와 가중 점수 합계를 계속 갱신
+# Subject 평균은 합계끼리 나누기만 하면 되고, Student 평균은 캐시해 두었다가 성적이 바뀔 때만 무효화
+# IncrementalGradebook은 성적이 보고될 때마다 listener(student, subject_name, score, weight)를 호출 -> 인덱스 등을 붙일 수 있음
+# check_consistency()는 원래 클래스의 전체 재계산 결과와 비교
+import math
+from functools import partial
 
 
+class IncrementalSubject(Subject):
+    def __init__(self, on_change=None):
+        super().__init__()
+        self._total = 0
+        self._total_weight = 0
+        self._on_change = on_change
 
+    def report_grade(self, score, weight):
+        super().report_grade(score, weight)
+        self._total += score * weight
+        self._total_weight += weight
+        if self._on_change is not None:
+            self._on_change(score, weight)
+
+    def report_grades(self, grades):
+        super().report_grades(grades)
+        self._total += sum(score * weight for score, weight in grades)
+        self._total_weight += sum(weight for _, weight in grades)
+        if self._on_change is not None:
+            for score, weight in grades:
+                self._on_change(score, weight)
 
+    def average_grade(self):
+        return self._total / self._total_weight
 
+    def check_consistency(self):
+        return math.isclose(self.average_grade(), Subject.average_grade(self))
 
 
+class IncrementalStudent(Student):
+    def __init__(self, name=None, book=None):
+        super().__init__()
+        self.name = name
+        self._book = book
+        self._average = None
 
+    def subject(self, name):
+        if name not in self._subjects:
+            self._subjects[name] = IncrementalSubject(partial(self._grade_changed, name))
+        return self._subjects[name]
 
+    def _grade_changed(self, subject_name, score, weight):
+        self._average = None
+        if self._book is not None:
+            self._book._grade_reported(self, subject_name, score, weight)
 
+    def average_grade(self):
+        if self._average is None:
+            self._average = super().average_grade()
+        return self._average
 
+    def check_consistency(self):
+        expected = Student.average_grade(self)
+        return (math.isclose(self.average_grade(), expected) and
+                all(subject.check_consistency() for subject in self._subjects.values()))
 
 
+class IncrementalGradebook(Gradebook):
+    def __init__(self):
+        super().__init__()
+        self._listeners = []
 
+    def student(self, name):
+        if name not in self._students:
+            self._students[name] = IncrementalStudent(name, self)
+        return self._students[name]
 
+    def add_listener(self, listener):
+        self._listeners.append(listener)
 
+    def _grade_reported(self, student, subject_name, score, weight):
+        for listener in self._listeners:
+            listener(student, subject_name, score, weight)
 
+    def check_consistency(self):
+        return all(student.check_consistency() for student in self._students.values())
 
+
+class IncrementalWeightedGradebook(WeightedGradebook):
+    def __init__(self):
+        super().__init__()
+        self._sums = {} # name -> {subject: [가중 점수 합계, 가중치 합계]}
+        self._averages = {}
+
+    def add_student(self, name):
+        super().add_student(name)
+        self._sums[name] = {}
+        self._averages.pop(name, None)
+
+    def report_grade(self, name, subject, score, weight):
+        super().report_grade(name, subject, score, weight)
+        self._add_sums(name, subject, [(score, weight)])
+
+    def report_grades(self, name, subject, grades):
+        super().report_grades(name, subject, grades)
+        self._add_sums(name, subject, grades)
+
+    def _add_sums(self, name, subject, grades):
+        sums = self._sums[name].setdefault(subject, [0, 0])
+        for score, weight in grades:
+            sums[0] += score * weight
+            sums[1] += weight
+        self._averages.pop(name, None)
+
+    def average_grade(self, name):
+        average = self._averages.get(name)
+        if average is None:
+            by_subject = self._sums[name]
+            score_sum = sum(total / total_weight for total, total_weight in by_subject.values())
+            average = self._averages[name] = score_sum / len(by_subject)
+        return average
+
+    def check_consistency(self, name):
+        return math.isclose(self.average_grade(name), WeightedGradebook.average_grade(self, name))
+
+
+book = IncrementalGradebook()
+albert = book.student('Albert Einstein')
+math_grades = albert.subject('Math')
+math_grades.report_grade(80, 0.1)
+math_grades.report_grade(80, 0.10)
+math_grades.report_grade(70, 0.80)
+gym = albert.subject('Gym')
+gym.report_grade(100, 0.40)
+print(albert.average_grade())
+gym.report_grade(85, 0.60) # 캐시된 평균이 무효화됨
+print(albert.average_grade())
+assert book.check_consistency()
+
+book = IncrementalWeightedGradebook()
+book.add_student('Albert Einstein')
+book.report_grade('Albert Einstein', 'Math', 80, 0.10)
+book.report_grade('Albert Einstein', 'Math', 80, 0.10)
+book.report_grade('Albert Einstein', 'Math', 70, 0.80)
+book.report_grade('Albert Einstein', 'Gym', 100, 0.40)
+book.report_grade('Albert Einstein', 'Gym', 85, 0.60)
+print(book.average_grade('Albert Einstein'))
+assert book.check_consistency('Albert Einstein')
+
+
+# 순위 인덱스: IncrementalGradebook의 listener로 붙어서 report_grade마다 해당 학생의 순위만 갱신
+# 폭(width)을 저장하는 indexable skip list에 (-평균, 이름)을 정렬해 두므로
+# top-K, 학생의 순위, 백분위를 O(log n) (top-K는 O(log n + K))에 구함
+from random import Random
+
+
+class _SkipNode(object):
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, next, width):
+        self.value = value
+        self.next = next
+        self.width = width
+
+
+class IndexableSkipList(object):
+    max_levels = 32
+
+    def __init__(self):
+        self._nil = _SkipNode(None, [], [])
+        self._head = _SkipNode(None, [self._nil] * self.max_levels, [1] * self.max_levels)
+        self._size = 0
+        self._random = Random() # 모듈 전역 random에 기대지 않고 높이 결정용 RNG를 직접 가짐
+
+    def __len__(self):
+        return self._size
+
+    def _node_at(self, index):
+        node = self._head
+        index += 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+        return node
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError('skip list index out of range')
+        return self._node_at(index).value
+
+    def iter_from(self, index, count):
+        if index >= self._size or count <= 0:
+            return
+        node = self._node_at(index)
+        for _ in range(min(count, self._size - index)):
+            yield node.value
+            node = node.next[0]
+
+    def rank(self, value):
+        # value보다 작은 원소의 수
+        node, rank = self._head, 0
+        for level in reversed(range(self.max_levels)):
+            while node.next[level] is not self._nil and node.next[level].value < value:
+                rank += node.width[level]
+                node = node.next[level]
+        return rank
+
+    def insert(self, value):
+        chain = [None] * self.max_levels
+        steps_at_level = [0] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level] is not self._nil and node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = 1
+        while height < self.max_levels and self._random.random() < 0.5:
+            height += 1
+        new_node = _SkipNode(value, [None] * height, [None] * height)
+        steps = 0
+        for level in range(height):
+            prev_node = chain[level]
+            new_node.next[level] = prev_node.next[level]
+            prev_node.next[level] = new_node
+            new_node.width[level] = prev_node.width[level] - steps
+            prev_node.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.max_levels):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, value):
+        chain = [None] * self.max_levels
+        node = self._head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level] is not self._nil and node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target is self._nil or target.value != value:
+            raise KeyError(value)
+        for level in range(len(target.next)):
+            prev_node = chain[level]
+            prev_node.width[level] += target.width[level] - 1
+            prev_node.next[level] = target.next[level]
+        for level in range(len(target.next), self.max_levels):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+
+class RankingIndex(object):
+    def __init__(self, book):
+        self._overall = (IndexableSkipList(), {}) # (skip list, 이름 -> 현재 key)
+        self._by_subject = {}
+        for student in book._students.values():
+            for subject_name, subject in student._subjects.items():
+                if subject._grades:
+                    self._grade_reported(student, subject_name, None, None)
+        book.add_listener(self._grade_reported)
+
+    def _index(self, subject):
+        if subject is None:
+            return self._overall
+        if subject not in self._by_subject:
+            self._by_subject[subject] = (IndexableSkipList(), {})
+        return self._by_subject[subject]
+
+    def _update(self, index, name, average):
+        skip_list, keys = index
+        old_key = keys.get(name)
+        if old_key is not None:
+            skip_list.remove(old_key)
+        keys[name] = (-average, name) # 평균이 높은 학생이 앞에 오도록
+        skip_list.insert(keys[name])
+
+    def _remove(self, index, name):
+        skip_list, keys = index
+        old_key = keys.pop(name, None)
+        if old_key is not None:
+            skip_list.remove(old_key)
+
+    def _grade_reported(self, student, subject_name, score, weight):
+        self._update(self._index(subject_name), student.name, student.subject(subject_name).average_grade())
+        try:
+            self._update(self._overall, student.name, student.average_grade())
+        except ZeroDivisionError:
+            self._remove(self._overall, student.name) # 아직 성적이 없는 과목이 있는 학생은 전체 순위에서 제외
+
+    def top(self, k, subject=None):
+        skip_list, _ = self._index(subject)
+        return [(name, -negative) for negative, name in skip_list.iter_from(0, k)]
+
+    def bottom(self, k, subject=None):
+        skip_list, _ = self._index(subject)
+        start = max(0, len(skip_list) - k)
+        values = list(skip_list.iter_from(start, k))
+        return [(name, -negative) for negative, name in reversed(values)]
+
+    def rank(self, name, subject=None):
+        skip_list, keys = self._index(subject)
+        return skip_list.rank(keys[name]) + 1 # 1등 = 1
+
+    def percentile(self, name, subject=None):
+        # 이 학생보다 평균이 낮은 학생의 비율(%)
+        skip_list, _ = self._index(subject)
+        return 100 * (len(skip_list) - self.rank(name, subject)) / len(skip_list)
+
+
+book = IncrementalGradebook()
+ranking = RankingIndex(book)
+for name, subject, score, weight in synthetic_grades(2000, students=50):
+    book.student(name).subject(subject).report_grade(score, weight)
+expected = sorted(((-student.average_grade(), name) for name, student in book._students.items()))
+assert ranking.top(5) == [(name, -negative) for negative, name in expected[:5]]
+assert ranking.rank(expected[10][1]) == 11
+print(ranking.top(3))
+print(ranking.bottom(1, subject='Math'), ranking.percentile('Student 7'))
+
+book = IncrementalGradebook()
+ranking = RankingIndex(book)
+book.student('A').subject('Math').report_grade(90, 1)
+book.student('B').subject('Math').report_grade(80, 1)
+book.student('A').subject('Gym') # 성적이 없는 과목이 생김
+book.student('A').subject('Math').report_grade(0, 99) # 예전 순위(90.0)가 남아 있으면 안 됨
+assert ranking.top(2) == [('B', 80.0)]
+
+
+# 대용량 CSV/NDJSON export를 batch 단위로 적재하는 bulk loader
+# 한 줄마다 report_grade를 부르는 대신 batch 안에서 (학생, 과목)별로 묶어
+# 각 gradebook의 report_grades(list.extend / array.extend)로 한 번에 붙임 -> 합계, listener 등은 gradebook이 갱신
+# SimpleGradeBook, BySubjectGradebook, WeightedGradebook, Gradebook(+ Incremental, Columnar 버전) 지원
+import csv
+import json
+import os
+from itertools import islice
+from time import perf_counter
+
+
+def _number(text):
+    if isinstance(text, (int, float)):
+        return text
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def read_grade_rows(path, fmt=None):
+    # CSV는 header에 student, subject, score, weight 컬럼, NDJSON은 같은 key를 가진 객체
+    # subject, weight가 없으면 None, 1로 채움
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            records = csv.DictReader(f)
+        elif fmt in ('ndjson', 'jsonl'):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError('Unknown grade file format %r' % fmt)
+        for record in records:
+            yield (record['student'], record.get('subject'), _number(record['score']),
+                   _number(record.get('weight', 1)))
+
+
+class LoadStats(object):
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class BulkLoader(object):
+    def __init__(self, book, batch_size=10000, progress=None):
+        self.book = book
+        self.batch_size = batch_size
+        self.progress = progress # batch마다 progress(stats) 호출
+        self._added = set() # add_student가 필요한 gradebook에서 이미 확인한 학생 이름
+
+    def load_file(self, path, fmt=None):
+        return self.load(read_grade_rows(path, fmt))
+
+    def load(self, rows):
+        stats = LoadStats()
+        start = perf_counter()
+        it = iter(rows)
+        while True:
+            batch = list(islice(it, self.batch_size))
+            if not batch:
+                break
+            self._append_batch(batch)
+            stats.rows += len(batch)
+            stats.batches += 1
+            stats.elapsed = perf_counter() - start
+            if self.progress is not None:
+                self.progress(stats)
+        return stats
+
+    def _append_batch(self, batch):
+        book = self.book
+        groups = {} # (학생, 과목) -> [(score, weight)], 처음 나온 순서 유지
+        for name, subject, score, weight in batch:
+            groups.setdefault((name, subject), []).append((score, weight))
+
+        for (name, subject), grades in groups.items():
+            if isinstance(book, (Gradebook, ColumnarGradebook)):
+                book.student(name).subject(subject).report_grades(grades)
+                continue
+            if name not in self._added:
+                if name not in book._grades:
+                    book.add_student(name)
+                self._added.add(name)
+            if isinstance(book, WeightedGradebook):
+                book.report_grades(name, subject, grades)
+            elif isinstance(book, BySubjectGradebook):
+                book.report_grades(name, subject, [score for score, _ in grades])
+            else: # SimpleGradeBook
+                book.report_grades(name, [score for score, _ in grades])
+
+
+from tempfile import TemporaryDirectory
+
+with TemporaryDirectory() as tmpdir:
+    csv_path = os.path.join(tmpdir, 'grades.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['student', 'subject', 'score', 'weight'])
+        writer.writerows(synthetic_grades(5000))
+    ndjson_path = os.path.join(tmpdir, 'grades.ndjson')
+    with open(ndjson_path, 'w') as f:
+        for name, subject, score, weight in synthetic_grades(5000):
+            f.write(json.dumps({'student': name, 'subject': subject, 'score': score, 'weight': weight}) + '\n')
+
+    expected = Gradebook()
+    for name, subject, score, weight in synthetic_grades(5000):
+        expected.student(name).subject(subject).report_grade(score, weight)
+    for factory in (SimpleGradeBook, BySubjectGradebook, WeightedGradebook, IncrementalWeightedGradebook,
+                    Gradebook, IncrementalGradebook, ColumnarGradebook):
+        book = factory()
+        load_stats = BulkLoader(book, batch_size=1000).load_file(csv_path)
+        if isinstance(book, (Gradebook, ColumnarGradebook)):
+            average = book.student('Student 3').average_grade()
+        else:
+            average = book.average_grade('Student 3')
+        print('%s: %d rows in %d batches, %.0f rows/s, %.2f' % (
+            factory.__name__, load_stats.rows, load_stats.batches, load_stats.rows_per_second, average))
+    book = IncrementalGradebook()
+    BulkLoader(book).load_file(ndjson_path)
+    assert book.check_consistency()
+    assert math.isclose(book.student('Student 3').average_grade(), expected.student('Student 3').average_grade())
+
+
+# 스냅샷 + append-only 로그로 Gradebook을 디스크에 보존 (ColumnarGradebook 기반)
+# report_grade마다 (길이, crc32, score, weight, 학생 이름, 과목 이름) 레코드를 log.<generation>에 덧붙임
+# snapshot()은 이름 테이블과 컬럼 array 4개를 snapshot.bin에 통째로 씀 -> 시작할 때 mmap으로 열어 frombytes로 바로 올림
+# (학생, 과목)별 합계도 array 4개로 함께 써 두므로 시작할 때 행을 다시 훑지 않고, replay는 로그 꼬리만 더함
+# 순서: 임시 파일에 generation + 1 스냅샷을 쓰고 fsync -> os.replace -> 디렉터리 fsync -> 새 로그 시작 -> 이전 로그 삭제
+# 시작할 때는 스냅샷의 generation에 해당하는 로그만 replay 하므로 어느 단계에서 죽어도 중복/누락이 없음
+# 로그 끝의 잘린 레코드나 crc가 맞지 않는 레코드는 버리고 그 위치에서 로그를 잘라냄
+# (파일은 little-endian으로 씀)
+import mmap
+import shutil
+import struct
+import zlib
+
+
+class PersistentGradebook(ColumnarGradebook):
+    snapshot_header = struct.Struct('<8sQQQQQ') # magic, generation, 학생 수, 과목 수, 성적 수, 합계 수
+    record_header = struct.Struct('<II') # payload 길이, crc32
+    record = struct.Struct('<ddHH') # score, weight, 학생 이름 길이, 과목 이름 길이
+    magic = b'GRADES02'
+
+    def __init__(self, directory, snapshot_every=None, fsync=False):
+        super().__init__()
+        self.directory = directory
+        self.snapshot_every = snapshot_every # 로그 레코드가 이만큼 쌓이면 자동으로 snapshot()
+        self.fsync = fsync # True면 레코드마다 fsync
+        self.generation = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_snapshot()
+        self.replayed = self._log_records = self._replay_log()
+        self._log = open(self._log_path(self.generation), 'ab')
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, 'snapshot.bin')
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, 'log.%d' % generation)
+
+    def _load_snapshot(self):
+        path = self._snapshot_path()
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                magic, self.generation, student_count, subject_count, row_count, sum_count = \
+                    self.snapshot_header.unpack_from(view, 0)
+                if magic != self.magic:
+                    raise ValueError('%s is not a gradebook snapshot' % path)
+                offset = self.snapshot_header.size
+                for intern, count in ((self._intern_student, student_count),
+                                      (self._intern_subject, subject_count)):
+                    for _ in range(count):
+                        size, = struct.unpack_from('<I', view, offset)
+                        intern(str(view[offset + 4:offset + 4 + size], 'utf-8'))
+                        offset += 4 + size
+                for column in (self._student, self._subject, self._score, self._weight):
+                    size = row_count * column.itemsize
+                    column.frombytes(view[offset:offset + size])
+                    offset += size
+                sum_columns = (array('i'), array('i'), array('d'), array('d'))
+                for column in sum_columns:
+                    size = sum_count * column.itemsize
+                    column.frombytes(view[offset:offset + size])
+                    offset += size
+            finally:
+                view.release()
+        for student_id, subject_id, total, total_weight in zip(*sum_columns):
+            self._sums[student_id][subject_id] = [total, total_weight]
+
+    def _replay_log(self):
+        path = self._log_path(self.generation)
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return 0
+        count, offset = 0, 0
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = len(mm)
+            while offset + self.record_header.size <= end:
+                size, crc = self.record_header.unpack_from(mm, offset)
+                start = offset + self.record_header.size
+                payload = mm[start:start + size]
+                if len(payload) != size or size < self.record.size or zlib.crc32(payload) != crc:
+                    break
+                score, weight, student_size, subject_size = self.record.unpack_from(payload, 0)
+                names = self.record.size + student_size
+                student_id = self._intern_student(payload[self.record.size:names].decode('utf-8'))
+                subject_id = self._intern_subject(payload[names:].decode('utf-8'))
+                ColumnarGradebook._append(self, student_id, subject_id, score, weight)
+                offset = start + size
+                count += 1
+        if offset != os.path.getsize(path):
+            with open(path, 'r+b') as f: # 깨진 꼬리는 잘라내야 뒤에 쓰는 레코드를 다시 읽을 수 있음
+                f.truncate(offset)
+        return count
+
+    def _write_record(self, student_id, subject_id, score, weight):
+        student = self._student_names[student_id].encode('utf-8')
+        subject = self._subject_names[subject_id].encode('utf-8')
+        payload = self.record.pack(score, weight, len(student), len(subject)) + student + subject
+        self._log.write(self.record_header.pack(len(payload), zlib.crc32(payload)))
+        self._log.write(payload)
+
+    def _logged(self, count):
+        if self.fsync:
+            self.sync()
+        self._log_records += count
+        if self.snapshot_every and self._log_records >= self.snapshot_every:
+            self.snapshot()
+
+    def _append(self, student_id, subject_id, score, weight):
+        self._write_record(student_id, subject_id, score, weight)
+        super()._append(student_id, subject_id, score, weight)
+        self._logged(1)
+
+    def _extend(self, student_id, subject_id, grades):
+        for score, weight in grades:
+            self._write_record(student_id, subject_id, score, weight)
+        super()._extend(student_id, subject_id, grades)
+        self._logged(len(grades))
+
+    def sync(self):
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _sync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def snapshot(self):
+        generation = self.generation + 1
+        tmp_path = self._snapshot_path() + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            sum_columns = (array('i'), array('i'), array('d'), array('d'))
+            for student_id, by_subject in enumerate(self._sums):
+                for subject_id, (total, total_weight) in by_subject.items():
+                    for column, value in zip(sum_columns, (student_id, subject_id, total, total_weight)):
+                        column.append(value)
+            f.write(self.snapshot_header.pack(self.magic, generation, len(self._student_names),
+                                              len(self._subject_names), len(self), len(sum_columns[0])))
+            for name in self._student_names + self._subject_names:
+                data = name.encode('utf-8')
+                f.write(struct.pack('<I', len(data)))
+                f.write(data)
+            for column in (self._student, self._subject, self._score, self._weight) + sum_columns:
+                column.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path())
+        self._sync_directory() # rename이 디스크에 남기 전에 이전 로그를 지우면 전원이 꺼졌을 때 로그 없는 옛 스냅샷이 돌아옴
+        self._log.close()
+        old_log = self._log_path(self.generation)
+        self.generation = generation
+        self._log = open(self._log_path(generation), 'ab')
+        self._log_records = 0
+        os.remove(old_log)
+
+    def close(self):
+        self._log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def gradebook_rows(book):
+    return list(zip([book._student_names[i] for i in book._student],
+                    [book._subject_names[i] for i in book._subject], book._score, book._weight))
+
+
+from random import Random
+
+with TemporaryDirectory() as tmpdir:
+    book_dir = os.path.join(tmpdir, 'book')
+    grades = list(synthetic_grades(300, students=7))
+    with PersistentGradebook(book_dir, snapshot_every=120) as book:
+        for name, subject, score, weight in grades[:250]:
+            book.student(name).subject(subject).report_grade(score, weight)
+        BulkLoader(book).load(grades[250:])
+        expected = gradebook_rows(book)
+    reference = ColumnarGradebook()
+    for name, subject, score, weight in expected:
+        reference.student(name).subject(subject).report_grade(score, weight)
+    with PersistentGradebook(book_dir) as book:
+        assert gradebook_rows(book) == expected
+        for name in reference._student_names: # 스냅샷에서 읽은 합계 + 로그 꼬리
+            assert math.isclose(book.student(name).average_grade(), reference.student(name).average_grade())
+        print('generation %d, replayed %d log records' % (book.generation, book.replayed))
+        log_name = 'log.%d' % book.generation
+        snapshot_rows = len(book) - book.replayed
+
+    # crash 일관성: 로그를 임의의 위치에서 잘라도 항상 앞부분의 성적만 온전히 복구되어야 함
+    log_size = os.path.getsize(os.path.join(book_dir, log_name))
+    crash_random = Random(20) # 실패하면 같은 잘림 위치로 재현할 수 있도록 고정 seed
+    for _ in range(50):
+        crash_dir = os.path.join(tmpdir, 'crash')
+        shutil.copytree(book_dir, crash_dir)
+        with open(os.path.join(crash_dir, log_name), 'r+b') as f:
+            f.truncate(crash_random.randint(0, log_size))
+        with PersistentGradebook(crash_dir) as book:
+            rows = gradebook_rows(book)
+            assert rows == expected[:len(rows)] and len(rows) >= snapshot_rows
+            book.student('Late').subject('Math').report_grade(90, 1.0) # 잘린 로그 뒤에 이어서 써도 다시 읽혀야 함
+        with PersistentGradebook(crash_dir) as book:
+            assert gradebook_rows(book) == rows + [('Late', 'Math', 90.0, 1.0)]
+        shutil.rmtree(crash_dir)
+    print('crash consistency checks passed')
+
+
+# 여러 스레드에서 report_grade를 호출하는 Gradebook (학생 이름의 hash로 lock striping)
+# student(), subject()의 "없으면 만들기"는 해당 stripe의 lock 안에서 다시 확인하므로 원자적
+# 한 학생과 그 과목들은 같은 lock을 쓰므로 report_grade와 평균 읽기는 항상 일관된 상태를 봄
+# averages()는 모든 stripe lock을 순서대로 잡고 전체 평균의 스냅샷을 만듦 (아직 성적이 없는 학생은 빠짐)
+# (CPython의 GIL 때문에 파이썬 코드 자체는 병렬로 돌지 않음. striping은 lock 경합을 줄여 줄 뿐)
+# 비교 기준은 stripe가 1개인 ConcurrentGradebook -> lock 수만 다르고 나머지 코드 경로는 같음
+from threading import RLock, Thread
+
+
+class ConcurrentSubject(IncrementalSubject):
+    def __init__(self, on_change, lock):
+        super().__init__(on_change)
+        self._lock = lock
+
+    def report_grade(self, score, weight):
+        with self._lock:
+            super().report_grade(score, weight)
+
+    def report_grades(self, grades):
+        with self._lock:
+            super().report_grades(grades)
+
+    def average_grade(self):
+        with self._lock:
+            return super().average_grade()
+
+
+class ConcurrentStudent(IncrementalStudent):
+    def __init__(self, name, lock):
+        super().__init__(name)
+        self._lock = lock
+
+    def subject(self, name):
+        subject = self._subjects.get(name)
+        if subject is None:
+            with self._lock:
+                subject = self._subjects.get(name)
+                if subject is None:
+                    subject = ConcurrentSubject(partial(self._grade_changed, name), self._lock)
+                    self._subjects[name] = subject
+        return subject
+
+    def average_grade(self):
+        with self._lock:
+            return super().average_grade()
+
+
+class ConcurrentGradebook(object):
+    def __init__(self, stripes=64):
+        self._locks = [RLock() for _ in range(stripes)]
+        self._shards = [{} for _ in range(stripes)]
+
+    def student(self, name):
+        stripe = hash(name) % len(self._locks)
+        shard = self._shards[stripe]
+        student = shard.get(name)
+        if student is None:
+            with self._locks[stripe]:
+                student = shard.get(name)
+                if student is None:
+                    student = shard[name] = ConcurrentStudent(name, self._locks[stripe])
+        return student
+
+    def averages(self):
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            return {name: student.average_grade()
+                    for shard in self._shards for name, student in shard.items()
+                    if student._subjects and all(subject._total_weight for subject in student._subjects.values())}
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+
+def stress_concurrent_gradebook(thread_counts=(1, 2, 4, 8), grades_per_thread=20000, students=1000):
+    results = []
+    for threads in thread_counts:
+        row = {'threads': threads}
+        for label in ('striped', 'global'):
+            book = ConcurrentGradebook(stripes=64 if label == 'striped' else 1)
+
+            def worker(offset, book=book):
+                rows = synthetic_grades(grades_per_thread, students=students)
+                for name, subject, score, weight in rows:
+                    name = '%s/%d' % (name, offset % 4)
+                    book.student(name).subject(subject).report_grade(score, weight)
+
+            workers = [Thread(target=worker, args=(i,)) for i in range(threads)]
+            start = perf_counter()
+            for thread in workers: thread.start()
+            for thread in workers: thread.join()
+            row[label] = threads * grades_per_thread / (perf_counter() - start)
+            reported = sum(len(subject._grades) for shard in book._shards
+                           for student in shard.values() for subject in student._subjects.values())
+            assert reported == threads * grades_per_thread # 경쟁 상태로 잃어버린 성적이 없어야 함
+        results.append(row)
+    return results
+
+
+book = ConcurrentGradebook(stripes=8)
+albert = book.student('Albert Einstein')
+threads = [Thread(target=albert.subject('Math').report_grade, args=(80, 0.1)) for _ in range(10)]
+for thread in threads: thread.start()
+for thread in threads: thread.join()
+assert len(albert.subject('Math')._grades) == 10
+book.student('Isaac Newton').subject('Math') # 성적이 없는 학생은 averages()에서 빠짐
+print(book.averages())
+for row in stress_concurrent_gradebook(thread_counts=(1, 4), grades_per_thread=5000):
+    print('%(threads)d threads: striped %(striped)d grades/s, global lock %(global)d grades/s' % row)
+
+
+# 과목별 전체 통계(평균, 표준편차, 최소/최대, 가중 평균)를 학생 shard 단위로 프로세스 풀에서 계산
+# 각 shard는 Welford 방식으로 (개수, 평균, M2)를 구하고, 부모에서 Chan의 병렬 분산 공식으로 합침
+# 합치는 순서는 shard 순서로 고정되어 있어 결과는 항상 같고, 순차 계산과 부동소수점 오차 범위에서 일치
+# 부모는 학생 이름 목록만 shard로 나눠 보내고, gradebook은 worker 초기화 때 한 번 넘김 (fork면 복사 없이 상속)
+# 성적을 꺼내는 일은 각 worker가 자기 shard에 대해서만 함. 성적이 없는 과목은 보고서에서 빠짐
+import multiprocessing
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+
+class SubjectStats(object):
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # 평균과의 차이 제곱의 합
+        self.min = math.inf
+        self.max = -math.inf
+        self.weighted_total = 0.0
+        self.total_weight = 0.0
+
+    def add(self, score, weight):
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        self.min = min(self.min, score)
+        self.max = max(self.max, score)
+        self.weighted_total += score * weight
+        self.total_weight += weight
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.weighted_total += other.weighted_total
+        self.total_weight += other.total_weight
+
+    def report(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'stdev': math.sqrt(self.m2 / self.count), # 모집단 표준편차
+            'min': self.min,
+            'max': self.max,
+            'weighted_average': self.weighted_total / self.total_weight,
+        }
+
+
+_shard_book = None # worker 프로세스의 gradebook
+
+
+def _init_shard_worker(book):
+    global _shard_book
+    _shard_book = book
+
+
+def shard_stats(names):
+    # names: 이 shard에 속한 학생 이름
+    by_subject = {}
+    for name in names:
+        for subject_name, subject in _shard_book._students[name]._subjects.items():
+            if not subject._grades:
+                continue
+            stats = by_subject.get(subject_name)
+            if stats is None:
+                stats = by_subject[subject_name] = SubjectStats()
+            for grade in subject._grades:
+                stats.add(grade.score, grade.weight)
+    return by_subject
+
+
+def gradebook_shards(book, shards):
+    names = sorted(book._students)
+    size = -(-len(names) // shards) if names else 1
+    for start in range(0, len(names), size):
+        yield names[start:start + size]
+
+
+def cohort_report(book, shards=None, workers=None, mp_context=None):
+    workers = workers or os.cpu_count()
+    shards = shards or workers * 4
+    merged = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                             initializer=_init_shard_worker, initargs=(book,)) as executor:
+        for partial_stats in executor.map(shard_stats, gradebook_shards(book, shards)):
+            for subject, stats in partial_stats.items():
+                merged.setdefault(subject, SubjectStats()).merge(stats)
+    return {subject: stats.report() for subject, stats in sorted(merged.items()) if stats.count}
+
+
+def cohort_report_serial(book):
+    by_subject = {}
+    for student in book._students.values():
+        for subject_name, subject in student._subjects.items():
+            by_subject.setdefault(subject_name, []).extend(subject._grades)
+    report = {}
+    for subject_name, grades in sorted(by_subject.items()):
+        if not grades:
+            continue
+        scores = [grade.score for grade in grades]
+        report[subject_name] = {
+            'count': len(scores),
+            'mean': statistics.fmean(scores),
+            'stdev': statistics.pstdev(scores),
+            'min': min(scores),
+            'max': max(scores),
+            'weighted_average': (sum(grade.score * grade.weight for grade in grades) /
+                                 sum(grade.weight for grade in grades)),
+        }
+    return report
+
+
+# spawn/forkserver worker는 이 파일을 import 하면서 crash 테스트, 스레드 stress, 벤치마크까지 모두 다시 실행함
+# 그래서 이 예제는 fork context에서만 돌리고 (fork가 없으면 생략), worker는 부모의 gradebook을 그대로 상속받음
+if __name__ == '__main__' and 'fork' in multiprocessing.get_all_start_methods():
+    book = Gradebook()
+    BulkLoader(book).load(synthetic_grades(20000))
+    book.student('Isaac Newton').subject('Music') # 성적이 없는 과목은 두 보고서 모두에서 빠짐
+    parallel_report = cohort_report(book, shards=7, workers=2, mp_context=multiprocessing.get_context('fork'))
+    serial_report = cohort_report_serial(book)
+    assert 'Music' not in parallel_report and parallel_report.keys() == serial_report.keys()
+    for subject, stats in serial_report.items():
+        for key, value in stats.items():
+            assert math.isclose(parallel_report[subject][key], value, rel_tol=1e-9)
+    print(parallel_report['Math'])
+
+
+# 성적 필터/그룹/집계를 위한 작은 쿼리 API
+# GradeIndex는 IncrementalGradebook의 listener로 붙어서 report_grade마다 행을 하나 추가하고
+# 과목별, 학생별 행 목록과 가중치 구간(bucket_width 단위)별 행 목록을 함께 갱신
+# 쿼리는 조건에 맞는 인덱스 중 후보 행이 가장 적은 것을 골라 그 행들만 검사하므로 전체를 훑지 않음
+# (후보 수는 행 목록 길이의 합으로 어림하므로 고르는 비용은 구간/학생 수에 비례)
+import re
+from itertools import chain
+
+
+class GradeIndex(object):
+    def __init__(self, book, bucket_width=0.1):
+        self.bucket_width = bucket_width
+        self._students = []
+        self._subjects = []
+        self._scores = []
+        self._weights = []
+        self._by_subject = {}
+        self._by_student = {}
+        self._by_weight = {} # 가중치 구간 번호 -> 행 목록
+        for student in book._students.values():
+            for subject_name, subject in student._subjects.items():
+                for grade in subject._grades:
+                    self._add(student.name, subject_name, grade.score, grade.weight)
+        book.add_listener(self._grade_reported)
+
+    def _grade_reported(self, student, subject_name, score, weight):
+        self._add(student.name, subject_name, score, weight)
+
+    def _bucket(self, weight):
+        return math.floor(weight / self.bucket_width)
+
+    def _add(self, name, subject, score, weight):
+        row = len(self._scores)
+        self._students.append(name)
+        self._subjects.append(subject)
+        self._scores.append(score)
+        self._weights.append(weight)
+        self._by_subject.setdefault(subject, []).append(row)
+        self._by_student.setdefault(name, []).append(row)
+        self._by_weight.setdefault(self._bucket(weight), []).append(row)
+
+    def query(self):
+        return GradeQuery(self)
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class GradeQuery(object):
+    aggregates = {
+        'count': len,
+        'sum': lambda grades: sum(score for score, _ in grades),
+        'mean': lambda grades: sum(score for score, _ in grades) / len(grades),
+        'weighted_mean': lambda grades: (sum(score * weight for score, weight in grades) /
+                                         sum(weight for _, weight in grades)),
+        'min': lambda grades: min(score for score, _ in grades),
+        'max': lambda grades: max(score for score, _ in grades),
+    }
+
+    def __init__(self, index):
+        self._index = index
+        self._subject = None
+        self._student_pattern = None
+        self._min_weight = None
+        self._max_weight = None
+        self._min_score = None
+        self._max_score = None
+        self._group_by = None
+
+    def where(self, subject=None, student_match=None, min_weight=None, max_weight=None,
+              min_score=None, max_score=None):
+        # 범위 조건은 모두 양 끝 포함
+        if subject is not None:
+            self._subject = subject
+        if student_match is not None:
+            self._student_pattern = re.compile(student_match)
+        if min_weight is not None:
+            self._min_weight = min_weight
+        if max_weight is not None:
+            self._max_weight = max_weight
+        if min_score is not None:
+            self._min_score = min_score
+        if max_score is not None:
+            self._max_score = max_score
+        return self
+
+    def group_by(self, field):
+        if field not in ('subject', 'student'):
+            raise ValueError('Can only group by subject or student')
+        self._group_by = field
+        return self
+
+    def _candidates(self):
+        # 조건마다 행 목록들만 모아 두고 (복사하지 않음) 길이 합이 가장 작은 것 하나만 펼침
+        # 나머지 조건은 rows()에서 _matches로 검사
+        index = self._index
+        options = []
+        if self._subject is not None:
+            options.append([index._by_subject.get(self._subject, [])])
+        if self._student_pattern is not None:
+            options.append([student_rows for name, student_rows in index._by_student.items()
+                            if self._student_pattern.search(name)])
+        if self._min_weight is not None or self._max_weight is not None:
+            buckets = index._by_weight
+            low = -math.inf if self._min_weight is None else index._bucket(self._min_weight)
+            high = math.inf if self._max_weight is None else index._bucket(self._max_weight)
+            if len(buckets) and (high - low) < len(buckets):
+                keys = range(int(low), int(high) + 1)
+            else:
+                keys = [key for key in buckets if low <= key <= high]
+            options.append([buckets[key] for key in keys if key in buckets])
+        if not options:
+            return range(len(index))
+        return chain.from_iterable(min(options, key=lambda row_lists: sum(map(len, row_lists))))
+
+    def _matches(self, row):
+        index = self._index
+        weight, score = index._weights[row], index._scores[row]
+        return ((self._subject is None or index._subjects[row] == self._subject) and
+                (self._student_pattern is None or self._student_pattern.search(index._students[row])) and
+                (self._min_weight is None or weight >= self._min_weight) and
+                (self._max_weight is None or weight <= self._max_weight) and
+                (self._min_score is None or score >= self._min_score) and
+                (self._max_score is None or score <= self._max_score))
+
+    def rows(self):
+        index = self._index
+        rows = sorted(row for row in self._candidates() if self._matches(row))
+        return [(index._students[row], index._subjects[row], index._scores[row], index._weights[row])
+                for row in rows]
+
+    def aggregate(self, name='mean'):
+        function = self.aggregates[name]
+        if self._group_by is None:
+            grades = [(score, weight) for _, _, score, weight in self.rows()]
+            return function(grades) if grades else None
+        groups = {}
+        for student, subject, score, weight in self.rows():
+            key = subject if self._group_by == 'subject' else student
+            groups.setdefault(key, []).append((score, weight))
+        return {key: function(grades) for key, grades in groups.items()}
+
+
+book = IncrementalGradebook()
+grade_index = GradeIndex(book)
+for name, subject, score, weight in synthetic_grades(5000):
+    book.student(name).subject(subject).report_grade(score, weight)
+heavy_math = grade_index.query().where(subject='Math', min_weight=0.5).rows()
+assert heavy_math == [(name, subject, score, weight) for name, subject, score, weight in synthetic_grades(5000)
+                      if subject == 'Math' and weight >= 0.5]
+print(len(heavy_math), 'Math grades with weight >= 0.5')
+print(grade_index.query().where(student_match=r' 1\d$').group_by('subject').aggregate('weighted_mean'))
+
+
+# 과목별/학생별 가중 분위수(median, p90, p99)를 위한 병합 가능한 sketch
+# 점수 범위 [low, high]를 bins개의 같은 폭 구간으로 나눠 구간별 가중치 합만 저장 (비어 있지 않은 구간만 dict에)
+# -> 메모리는 최대 bins개, 가중치 삽입이 그대로 되고, 같은 설정의 sketch끼리는 구간별로 더하기만 하면 정확히 병합됨
+# 분위수 추정값은 참값과 같은 구간 안에 있으므로 오차는 구간 폭(error_bound) 이하
+# 범위 밖의 점수는 양 끝 구간에 넣고 out_of_range로 세며, 이때 error_bound는 보장하지 않음(inf)
+# 성적 분포는 범위가 정해져 있으므로 t-digest/KLL 대신 고정 구간 히스토그램을 사용
+class QuantileSketch(object):
+    def __init__(self, low=0, high=100, bins=1000):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.width = (high - low) / bins
+        self.total_weight = 0
+        self.count = 0
+        self.out_of_range = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._weights = {} # 구간 번호 -> 가중치 합
+
+    def add(self, value, weight=1):
+        if weight <= 0:
+            raise ValueError('Weight must be positive')
+        if value < self.low or value > self.high:
+            self.out_of_range += 1
+        index = min(max(int((value - self.low) / self.width), 0), self.bins - 1)
+        self._weights[index] = self._weights.get(index, 0) + weight
+        self.total_weight += weight
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if (self.low, self.high, self.bins) != (other.low, other.high, other.bins):
+            raise ValueError('Can only merge sketches with the same range and bins')
+        for index, weight in other._weights.items():
+            self._weights[index] = self._weights.get(index, 0) + weight
+        self.total_weight += other.total_weight
+        self.count += other.count
+        self.out_of_range += other.out_of_range
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        if not 0 <= q <= 1:
+            raise ValueError('q must be between 0 and 1')
+        if not self.count:
+            raise ValueError('Empty sketch')
+        target = q * self.total_weight
+        cumulative = 0
+        for index in sorted(self._weights):
+            weight = self._weights[index]
+            if cumulative + weight >= target:
+                value = self.low + (index + (target - cumulative) / weight) * self.width
+                return min(max(value, self.min), self.max)
+            cumulative += weight
+        return self.max
+
+    @property
+    def error_bound(self):
+        return math.inf if self.out_of_range else self.width
+
+    def __len__(self):
+        return len(self._weights)
+
+
+class SketchedWeightedGradebook(IncrementalWeightedGradebook):
+    # store_grades=False면 (score, weight) 목록을 저장하지 않고 합계와 sketch만 유지 (평균은 합계로 계산)
+    # 가중치 0인 성적은 WeightedGradebook처럼 받되 분위수에는 영향이 없으므로 sketch에는 넣지 않음
+    def __init__(self, store_grades=True, low=0, high=100, bins=1000):
+        super().__init__()
+        self.store_grades = store_grades
+        self._sketch_options = dict(low=low, high=high, bins=bins)
+        self._subject_sketches = {}
+        self._student_sketches = {}
+
+    def _new_sketch(self):
+        return QuantileSketch(**self._sketch_options)
+
+    def report_grade(self, name, subject, score, weight):
+        self.report_grades(name, subject, [(score, weight)])
+
+    def report_grades(self, name, subject, grades):
+        # BulkLoader도 이 경로로 들어오므로 bulk 적재에서도 sketch가 만들어지고 store_grades를 따름
+        # batch 전체를 먼저 검사하므로 중간에 실패해서 성적/합계와 sketch가 어긋나는 일이 없음
+        if any(weight < 0 for _, weight in grades):
+            raise ValueError('Weight must not be negative')
+        if self.store_grades:
+            super().report_grades(name, subject, grades)
+        else:
+            self._add_sums(name, subject, grades)
+        if subject not in self._subject_sketches:
+            self._subject_sketches[subject] = self._new_sketch()
+        if name not in self._student_sketches:
+            self._student_sketches[name] = self._new_sketch()
+        subject_sketch = self._subject_sketches[subject]
+        student_sketch = self._student_sketches[name]
+        for score, weight in grades:
+            if weight:
+                subject_sketch.add(score, weight)
+                student_sketch.add(score, weight)
+
+    def subject_sketch(self, subject):
+        return self._subject_sketches[subject]
+
+    def student_sketch(self, name):
+        return self._student_sketches[name]
+
+    def cohort_sketch(self, names):
+        # 여러 학생(또는 다른 shard의 sketch)을 병합
+        merged = self._new_sketch()
+        for name in names:
+            merged.merge(self._student_sketches[name])
+        return merged
+
+
+def weighted_quantile(grades, q):
+    grades = sorted(grades)
+    target = q * sum(weight for _, weight in grades)
+    cumulative = 0
+    for score, weight in grades:
+        cumulative += weight
+        if cumulative >= target:
+            return score
+    return grades[-1][0]
+
+
+book = SketchedWeightedGradebook()
+lean_book = SketchedWeightedGradebook(store_grades=False)
+math_grades = []
+for name, subject, score, weight in synthetic_grades(5000):
+    for sketched in (book, lean_book):
+        if name not in sketched._grades:
+            sketched.add_student(name)
+        sketched.report_grade(name, subject, score - weight / 7, weight)
+    if subject == 'Math':
+        math_grades.append((score - weight / 7, weight))
+sketch = book.subject_sketch('Math')
+for q in (0.5, 0.9, 0.99):
+    estimate, exact = sketch.quantile(q), weighted_quantile(math_grades, q)
+    assert abs(estimate - exact) <= sketch.error_bound
+    print('Math p%g: %.2f (exact %.2f, error bound %.2f)' % (q * 100, estimate, exact, sketch.error_bound))
+assert lean_book.average_grade('Student 3') == book.average_grade('Student 3')
+bulk_book = SketchedWeightedGradebook(store_grades=False)
+BulkLoader(bulk_book, batch_size=1000).load(
+    (name, subject, score - weight / 7, weight) for name, subject, score, weight in synthetic_grades(5000))
+assert not any(bulk_book._grades.values()) # 성적 목록은 저장하지 않음
+assert bulk_book.subject_sketch('Math').count == sketch.count
+assert math.isclose(bulk_book.subject_sketch('Math').quantile(0.5), sketch.quantile(0.5))
+bulk_book.add_student('A')
+bulk_book.report_grades('A', 'Math', [(50, 1), (60, 0)]) # 가중치 0은 합계에만 들어감
+try:
+    bulk_book.report_grades('A', 'Math', [(70, 1), (80, -1)])
+except ValueError:
+    pass
+else:
+    assert False
+assert bulk_book.student_sketch('A').count == 1 and bulk_book.average_grade('A') == 50
+cohort = book.cohort_sketch(['Student %d' % i for i in range(10)])
+print('median of 10 students: %.2f, sketch bins used: %d' % (cohort.quantile(0.5), len(cohort)))
+
+
+# 모든 gradebook 버전의 메모리/속도 벤치마크
+# 크기별(기본 10**4 ~ 10**7) synthetic 워크로드를 각 버전에 넣고
+#   bytes_per_grade: tracemalloc으로 잰 성적당 메모리 (별도 실행)
+#   inserts_per_second: report_grade 처리량 (워크로드 생성 시간은 제외하도록 chunk 단위로 미리 만듦)
+#   query_latency_us: average_grade 한 번의 평균 지연 시간
+# 결과는 JSON 파일로 저장해서 회귀를 추적할 수 있게 함
+import platform
+from datetime import datetime
+
+
+def _add_to_dict_book(book, name, subject, score, weight):
+    if name not in book._grades:
+        book.add_student(name)
+    if isinstance(book, SimpleGradeBook):
+        book.report_grade(name, score)
+    elif isinstance(book, WeightedGradebook):
+        book.report_grade(name, subject, score, weight)
+    else:
+        book.report_grade(name, subject, score)
+
+
+def _add_to_class_book(book, name, subject, score, weight):
+    book.student(name).subject(subject).report_grade(score, weight)
+
+
+BENCHMARK_VARIANTS = {
+    'SimpleGradeBook': (SimpleGradeBook, _add_to_dict_book, lambda book, name: book.average_grade(name)),
+    'BySubjectGradebook': (BySubjectGradebook, _add_to_dict_book, lambda book, name: book.average_grade(name)),
+    'WeightedGradebook': (WeightedGradebook, _add_to_dict_book, lambda book, name: book.average_grade(name)),
+    'IncrementalWeightedGradebook': (IncrementalWeightedGradebook, _add_to_dict_book,
+                                     lambda book, name: book.average_grade(name)),
+    'Gradebook': (Gradebook, _add_to_class_book, lambda book, name: book.student(name).average_grade()),
+    'IncrementalGradebook': (IncrementalGradebook, _add_to_class_book,
+                             lambda book, name: book.student(name).average_grade()),
+    'ColumnarGradebook': (ColumnarGradebook, _add_to_class_book,
+                          lambda book, name: book.student(name).average_grade()),
+}
+
+
+def _load_benchmark_book(variant, count, chunk_size=100000):
+    factory, add, _ = BENCHMARK_VARIANTS[variant]
+    book = factory()
+    rows = synthetic_grades(count)
+    elapsed = 0.0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        start = perf_counter()
+        for name, subject, score, weight in chunk:
+            add(book, name, subject, score, weight)
+        elapsed += perf_counter() - start
+    return book, elapsed
+
+
+def benchmark_gradebooks(sizes=(10**4, 10**5, 10**6, 10**7), variants=None, queries=100, report_path=None):
+    results = []
+    for count in sizes:
+        students = max(1, count // 100) # synthetic_grades의 기본 학생 수
+        names = ['Student %d' % (i * students // queries) for i in range(min(queries, students))]
+        for variant in variants or BENCHMARK_VARIANTS:
+            book, elapsed = _load_benchmark_book(variant, count)
+            query = BENCHMARK_VARIANTS[variant][2]
+            start = perf_counter()
+            for name in names:
+                query(book, name)
+            query_latency = (perf_counter() - start) / len(names)
+            del book
+
+            tracemalloc.start()
+            try:
+                book, _ = _load_benchmark_book(variant, count)
+                current, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            del book
+
+            results.append({
+                'variant': variant,
+                'grades': count,
+                'bytes_per_grade': current / count,
+                'inserts_per_second': count / elapsed,
+                'query_latency_us': query_latency * 1e6,
+            })
+    report = {
+        'created': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if report_path is not None:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+with TemporaryDirectory() as tmpdir:
+    report_path = os.path.join(tmpdir, 'gradebook_benchmark.json')
+    benchmark_gradebooks(sizes=(10**4,), queries=20, report_path=report_path) # 전체 측정은 기본 sizes로 실행
+    with open(report_path) as f:
+        benchmark_report = json.load(f)
+for row in benchmark_report['results']:
+    print('%(variant)s (%(grades)d grades): %(bytes_per_grade).1f bytes/grade, '
+          '%(inserts_per_second).0f inserts/s, %(query_latency_us).1f us/query' % row)